@@ -0,0 +1,151 @@
+"""Cached command line parsing for the CLI tools built from arg data files
+
+Each arg data file (under discovery/argfiles) describes the arguments of
+every endpoint an API exposes. Parsing it & building a parser for every
+endpoint takes up most of a tool's startup time, so the parsed arg data is
+pickled between runs, and only the selected endpoint's parser is built.
+
+Every endpoint's arg data holds a "defaults" dict, which is set on its parser.
+That's how each tool finds out which endpoint was selected.
+"""
+import argparse
+import sys
+import pickle
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Optional
+
+import json_io
+
+
+__all__ = (
+    'prepare_args',
+    'parse_arg_data',
+    'is_selected',
+    'add_entity_type_parser',
+    'add_endpoint_parser',
+    'add_endpoint_args',
+    'parse_endpoint_args',
+)
+
+type_map = {
+    "string": str,
+    "integer": int,
+    "boolean": bool,
+    "FILE": argparse.FileType('r', encoding='UTF-8')
+}
+
+
+def prepare_args(endpoint: dict) -> None:
+    """Substitute an endpoint's arg types with their parsing functions
+
+    The request body is optional, since it's read from stdin by default.
+    """
+    for arg in endpoint["args"]:
+        arg["data"]["type"] = type_map[arg["data"]["type"]]
+        if arg["name"] == "body":
+            arg["data"]["nargs"] = "?"
+
+
+@lru_cache(maxsize=1)
+def load_arg_data(
+    data_path: Path,
+    cache_path: Path,
+    digest: str,
+    prepare: Callable[[list[dict]], list[dict]]
+) -> list[dict]:
+    """Serialize arg data JSON into code
+
+    The loaded json is passed through the tool's prepare function. The result
+    is pickled to the cache path, and reused by later invocations for as long
+    as the arg data file's content hash is unchanged.
+    """
+    try:
+        cached_digest, arg_data = pickle.loads(cache_path.read_bytes())
+        if cached_digest == digest:
+            return arg_data
+    except Exception:
+        # A missing, truncated or stale cache (e.g. one pickled by an older
+        # version of the tool) can fail in many ways, so just rebuild it
+        pass
+
+    arg_data = prepare(json_io.loads(data_path.read_bytes()))
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_bytes(pickle.dumps((digest, arg_data)))
+    return arg_data
+
+
+def parse_arg_data(
+    data_path: Path,
+    cache_path: Path,
+    prepare: Callable[[list[dict]], list[dict]]
+) -> list[dict]:
+    """Returns the (possibly cached) arg data for the arg data file"""
+    digest = hashlib.blake2b(data_path.read_bytes(), digest_size=16).hexdigest()
+    return load_arg_data(data_path, cache_path, digest, prepare)
+
+
+def is_selected(name: str, tokens: Optional[list[str]]) -> bool:
+    """Check whether a command is the next one named on the command line
+
+    A tokens value of None means that every command should be built.
+    """
+    return tokens is None or tokens[:1] == [name]
+
+
+def add_entity_type_parser(
+    parser, entity_type: dict, tokens: Optional[list[str]] = None
+) -> None:
+    """Simplified interface to add entity type parsers to argparser"""
+    entity_parser = parser.add_parser(entity_type['name'], help=entity_type['help'])
+    if not is_selected(entity_type['name'], tokens):
+        # placeholder, so that the entity type is still listed in usage messages
+        return
+    endpoints = entity_type['endpoints']
+    subparser = entity_parser.add_subparsers(
+        description="Declare which endpoints to call",
+        required=True)
+
+    for endpoint in endpoints:
+        add_endpoint_parser(subparser, endpoint)
+
+
+def add_endpoint_parser(parser, endpoint: dict) -> None:
+    """Simplified interface to add endpoint parsers to argparser"""
+    endpoint_parser = parser.add_parser(endpoint['name'], help=endpoint['help'])
+    add_endpoint_args(endpoint_parser, endpoint)
+
+
+def add_endpoint_args(endpoint_parser, endpoint: dict) -> None:
+    """Add an endpoint's arguments to its parser"""
+    endpoint_parser.set_defaults(**endpoint['defaults'])
+    for arg in endpoint['args']:
+        arg_spec = arg.get('data', {})
+        if arg['name'] == 'body':
+            # stdin can't be pickled, so it's kept out of the cached arg data
+            arg_spec = arg_spec | {'default': sys.stdin}
+        endpoint_parser.add_argument(arg['name'], **arg_spec)
+
+
+def parse_endpoint_args(
+    argv: list[str], endpoints: dict[tuple[str, ...], dict], depth: int
+) -> Optional[argparse.Namespace]:
+    """Parse the command line directly against the selected endpoint
+
+    The first depth tokens name the endpoint, as a key of endpoints, so it's
+    looked up directly rather than having argparse build a subparser for
+    every endpoint. Returns None if they don't name an endpoint, or if help is
+    requested for a command group, so the full parser can be used instead.
+    """
+    if len(argv) < depth or any(token.startswith('-') for token in argv[:depth]):
+        return None
+    endpoint = endpoints.get(tuple(argv[:depth]))
+    if endpoint is None:
+        return None
+
+    parser = argparse.ArgumentParser(
+        prog=" ".join([Path(sys.argv[0]).name, *argv[:depth]]),
+        description=endpoint['help'])
+    add_endpoint_args(parser, endpoint)
+    return parser.parse_args(argv[depth:])
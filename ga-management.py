@@ -3,129 +3,211 @@
 
 import json
 import argparse
-import time
-import random
 import sys
 from pathlib import Path
+from typing import Iterator, Any, Optional
 
-from google_auth import Services, send_request
+import json_io
+import argfiles
 
-service=Services.from_auth_context("GoogleAds").analytics_management_service
 arg_data_path=Path("/Users/stevenmurray/google_apis/discovery/argfiles/ga-management.json")
+cache_path=Path.home() / ".cache/ga-management/args.v5.pkl"
+# GA allows at most 10 concurrent requests per view, so cap batches there
+BATCH_SIZE=10
 
-type_map = {
-    "string": str,
-    "integer": int,
-    "boolean": bool,
-    "FILE": argparse.FileType('r', encoding='UTF-8')
-}
 
-
-def is_non_redundant(arg_data: dict, endpoint_data: dict, entity_data: dict):
-    """Determine whether the current attribute is a redundant entity id"""
-    return arg_data["name"] != f'{entity_data["name"][:-1]}Id' \
-        or "body" not in map(lambda e: e["name"], endpoint_data["args"])
-
-
-def parse_arg_data(data_path: Path):
-    """Serialize arg data JSON into code
-
-    In addition to loading the json, this substitutes a couple values in the
-    arg data with functions.
-    """
-    arg_data = json.loads(data_path.read_text())
+def prepare_arg_data(arg_data: list[dict]) -> list[dict]:
+    """Prune redundant entity id args, and record each endpoint's library path"""
     for api in arg_data:
         api['help'] = f"Invokes the GA {api['name']} API"
         for entity in api["entities"]:
+            # The entity's id is redundant when the request body is passed, since
+            # it's read from the body instead
+            redundant_id = f'{entity["name"][:-1]}Id'
             for endpoint in entity["endpoints"]:
-                endpoint["library_func"] = getattr(
-                    getattr(
-                        getattr(service, api["name"])(),
-                        entity["name"])(),
-                    endpoint["name"])
-                endpoint["args"] = list(filter(
-                    lambda arg: is_non_redundant(arg, endpoint, entity),
-                    endpoint["args"]))
-                for arg in endpoint["args"]:
-                    arg["data"]["type"] = type_map[arg["data"]["type"]]
-                    if arg["name"] == "body":
-                        arg["data"]["nargs"] = "?"
-                        arg["data"]["default"] = sys.stdin
+                # The (api, entity, endpoint) path is the only dispatch data
+                # argparse needs to carry; everything else about the endpoint
+                # is derived from it
+                endpoint["defaults"] = {"lib_path": (
+                    api["name"], entity["name"], endpoint["name"])}
+                if any(arg["name"] == "body" for arg in endpoint["args"]):
+                    endpoint["args"] = [
+                        arg for arg in endpoint["args"]
+                        if arg["name"] != redundant_id]
+                argfiles.prepare_args(endpoint)
     return arg_data
 
 
-def add_api_selection_parser(parser, api_data: dict) -> None:
+def parse_arg_data(data_path: Path) -> list[dict]:
+    """Returns the (possibly cached) arg data for the arg data file"""
+    return argfiles.parse_arg_data(data_path, cache_path, prepare_arg_data)
+
+
+def resolve_library_func(service, lib_path: tuple[str, str, str]):
+    """Walk the service's resource tree down to an endpoint's library function
+
+    Building each resource object is relatively expensive, so this is only
+    done for the endpoint that was actually selected on the command line.
+    """
+    api, entity, endpoint = lib_path
+    return getattr(getattr(getattr(service, api)(), entity)(), endpoint)
+
+
+def add_api_selection_parser(
+    parser, api_data: dict, tokens: Optional[list[str]] = None
+) -> None:
     api_parser = parser.add_parser(api_data['name'], help=api_data['help'])
+    if not argfiles.is_selected(api_data['name'], tokens):
+        # placeholder, so that the API is still listed in usage messages
+        return
     entities = api_data['entities']
     subparser = api_parser.add_subparsers(
         description="Declare which entity type to operate on",
         required=True)
 
     for entity_type in entities:
-        add_entity_type_parser(subparser, entity_type)
-
+        argfiles.add_entity_type_parser(
+            subparser, entity_type, None if tokens is None else tokens[1:])
 
-def add_entity_type_parser(parser, entity_type: dict) -> None:
-    """Simplified interface to add entity type parsers to argparser"""
-    entity_parser = parser.add_parser(entity_type['name'], help=entity_type['help'])
-    entity_parser.set_defaults(entity=entity_type['name'])
-    endpoints = entity_type['endpoints']
-    subparser = entity_parser.add_subparsers(
-        description="Declare which endpoints to call",
-        required=True)
 
-    for endpoint in endpoints:
-        add_endpoint_parser(subparser, endpoint)
+def parse_endpoint_args(argv: list[str], arg_data: list[dict]) -> Optional[argparse.Namespace]:
+    """Parse the command line directly against the selected endpoint
 
-
-def add_endpoint_parser(parser, endpoint: dict) -> None:
-    """Simplified interface to add endpoint parsers to argparser"""
-    endpoint_parser = parser.add_parser(endpoint['name'], help=endpoint['help'])
-    endpoint_parser.set_defaults(
-        library_func=endpoint['library_func'],
-        endpoint=endpoint['name']
-    )
-    for arg in endpoint['args']:
-        endpoint_parser.add_argument(arg['name'], **arg.get('data', {}))
+    The first three tokens name the API, entity type, and endpoint.
+    """
+    endpoints = {
+        (api["name"], entity["name"], endpoint["name"]): endpoint
+        for api in arg_data
+        for entity in api["entities"]
+        for endpoint in entity["endpoints"]
+    }
+    return argfiles.parse_endpoint_args(argv, endpoints, 3)
 
 
 def read_input(parser):
     """Produce a stream of JSON report requests from CLI args
 
     This attempts to read the input file as a JSONL, or if that fails, then as a
-    JSONL file. Each found input is yielded one at a time.
+    JSON file. The input is read as raw bytes, which skips decoding it into a
+    str before parsing it.
     """
-    lines = [line for line in parser.body]
+    data = getattr(parser.body, 'buffer', parser.body).read()
     try:
-        return [json.loads(line) for line in lines]
+        return [json_io.loads(line) for line in data.splitlines() if line.strip()]
     except json.JSONDecodeError:
-        return json.loads('\n'.join(lines))
+        document = json_io.loads(data)
+        return document if isinstance(document, list) else [document]
 
 
-def init_parsers(parser: argparse.ArgumentParser) -> None:
-    """Add an argument parser for each supported API"""
+def paginate(library_func, request, params: dict) -> Iterator[dict]:
+    """Yield every page of results from a list endpoint
+
+    Uses the client library's list_next where the API pages by page token,
+    and otherwise follows the start-index paging of the GA Management API.
+    """
+    from google_auth import send_request
+
+    resource = library_func.__self__
+    while request is not None:
+        page = send_request(request)
+        yield page
+        if hasattr(resource, "list_next"):
+            request = resource.list_next(request, page)
+        elif "nextLink" in page:
+            next_index = page["startIndex"] + page["itemsPerPage"]
+            request = library_func(**(params | {"start_index": next_index}))
+        else:
+            request = None
+
+
+def send_batched(service, requests: list) -> Iterator:
+    """Send requests in batches, yielding responses in submission order
+
+    Each batch of up to BATCH_SIZE requests is sent in a single HTTP round
+    trip. Requests which fail within a batch are retried individually, so
+    that they still get send_request's backoff handling.
+    """
+    # Lazy load expensive modules
+    from googleapiclient.errors import HttpError
+    from google_auth import send_request, is_retryable
+
+    if len(requests) == 1:
+        yield send_request(requests[0])
+        return
+
+    for offset in range(0, len(requests), BATCH_SIZE):
+        chunk = requests[offset:offset + BATCH_SIZE]
+        results: dict[str, Any] = {}
+
+        def store_result(request_id, response, exception) -> None:
+            results[request_id] = response if exception is None else exception
+
+        batch = service.new_batch_http_request(callback=store_result)
+        for n, request in enumerate(chunk):
+            batch.add(request, request_id=str(n))
+        send_request(batch)
+
+        for n, request in enumerate(chunk):
+            result = results[str(n)]
+            if isinstance(result, HttpError):
+                if not is_retryable(result):
+                    raise result
+                result = send_request(request)
+            yield result
+
+
+def raw_content(resp, content: bytes) -> bytes:
+    """Response post-processor that skips decoding the response JSON
+
+    Empty bodies (e.g. from deletes) are written as an empty JSON object, so
+    that every output line is still a JSON document.
+    """
+    return content or b'{}'
+
+
+def init_parsers(
+    parser: argparse.ArgumentParser, argv: Optional[list[str]] = None
+) -> None:
+    """Add an argument parser for each supported API
+
+    If the command line arguments are given, only the branch of the parser
+    tree that they select is built out in full. The other APIs & entity types
+    just get placeholder parsers, so they're still listed in usage messages.
+    """
     subparser = parser.add_subparsers(
         description="Declare which API to invoke",
         required=True)
 
     for entity_type in parse_arg_data(arg_data_path):
-        add_api_selection_parser(subparser, entity_type)
+        add_api_selection_parser(subparser, entity_type, argv)
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Create requests against the GA Management API")
+def get_cli_opts(argv: list[str]) -> argparse.Namespace:
+    cmd_args = parse_endpoint_args(argv, parse_arg_data(arg_data_path))
+    if cmd_args is None:
+        parser = argparse.ArgumentParser(
+            description="Create requests against the GA Management API")
+        init_parsers(parser, argv)
+        cmd_args = parser.parse_args(argv)
+    return cmd_args
+
 
-    init_parsers(parser)
-    cmd_args = parser.parse_args()
-    library_func = cmd_args.library_func
+def main(argv: Optional[list[str]] = None) -> None:
+    """Make the requests described by the command line arguments"""
+    cmd_args = get_cli_opts(sys.argv[1:] if argv is None else argv)
+    # Only import the client libraries & authenticate once the command line
+    # is known to be valid
+    from google_auth import Services
+    service = Services.from_auth_context("GoogleAds").analytics_management_service
+    _, entity, endpoint = cmd_args.lib_path
+    library_func = resolve_library_func(service, cmd_args.lib_path)
 
     # Mutate operations will likely be provided in bulk, but read operations are
     # generally 1 operation per command invocation
     # I've tried to keep the general program flow the same between both
     # cases by using a couple dummy variables in the "read" case
     if hasattr(cmd_args, 'body'):
-        idname = f"{cmd_args.entity[:-1]}Id"
+        idname = f"{entity[:-1]}Id"
         request_queue = read_input(cmd_args)
         delattr(cmd_args, 'body')
         obj_data = lambda obj: {idname: obj["id"], "body": obj}
@@ -134,12 +216,24 @@ if __name__ == "__main__":
         request_queue = [None]
         build_request = lambda _: library_func(**vars(cmd_args))
 
-    delattr(cmd_args, 'entity')
-    delattr(cmd_args, 'endpoint')
-    delattr(cmd_args, 'library_func')
+    delattr(cmd_args, 'lib_path')
 
-    for item in request_queue:
-        request = build_request(item)
-        response = send_request(request)
-        json.dump(response, sys.stdout)
-        print()
+    requests = [build_request(item) for item in request_queue]
+    if endpoint == "list":
+        for request in requests:
+            # Walk every page in this process, one response per output line
+            for page in paginate(library_func, request, vars(cmd_args)):
+                json_io.write_line(page, sys.stdout)
+    else:
+        # Pass the response bodies through untouched, rather than parsing them
+        # into dicts only to serialize them straight back out
+        for request in requests:
+            request.postproc = raw_content
+        for response in send_batched(service, requests):
+            sys.stdout.buffer.write(response)
+            sys.stdout.buffer.write(b"\n")
+            sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,15 +9,19 @@ import sys
 import math
 import logging
 import io
-from warnings import warn
-from typing import Iterator, NamedTuple, TYPE_CHECKING, Any
-from datetime import date, timedelta
-from copy import deepcopy
-from collections.abc import Mapping
-from itertools import chain
-
-from google_auth import Services, send_request
-
+import hashlib
+from pathlib import Path
+from typing import Iterator, NamedTuple, Any, Optional
+from functools import cache
+from datetime import date
+from collections import deque
+from collections.abc import Iterable
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+from attrs import define, field
+
+import json_io
 import uar
 
 
@@ -26,7 +30,68 @@ class DateRange(NamedTuple):
     end_date: str
 
 
-service = Services.from_auth_context("GoogleAds").analytics_service
+# Report requests are I/O bound, so several are kept in flight at once.
+# send_request's limiter still backs off if the API starts throttling
+MAX_WORKERS = 8
+MAX_PENDING = 2 * MAX_WORKERS
+OUTPUT_BUFFER_SIZE = 1 << 20
+# GA allows up to 5 report requests in each batchGet, so long as they share
+# these fields
+MAX_REPORT_REQUESTS = 5
+SHARED_REQUEST_KEYS = ("viewId", "dateRanges", "samplingLevel", "segments", "cohortGroup")
+CACHE_DIR = Path.home() / ".cache/ga-reporting/responses"
+
+
+def is_cacheable(request_body: dict) -> bool:
+    """Check whether a request's response is final, so can be cached
+
+    Relative dates (e.g. 'yesterday' or '7daysAgo') and date ranges ending
+    today or later give different responses from one day to the next, as do
+    requests without date ranges, which default to the last 7 days.
+    """
+    today = date.today()
+    try:
+        for request in request_body["reportRequests"]:
+            date_ranges = request.get("dateRanges")
+            if not date_ranges:
+                return False
+            for date_range in date_ranges:
+                date.fromisoformat(date_range["startDate"])
+                if date.fromisoformat(date_range["endDate"]) >= today:
+                    return False
+    except (KeyError, TypeError, ValueError):
+        return False
+    return True
+
+
+@define
+class ResponseCache:
+    """File-backed cache of report responses, keyed by their request body
+
+    Re-running a set of report requests (e.g. after a crash) only sends the
+    requests that didn't already get a response. Only requests for fixed date
+    ranges which have already ended are cached.
+    """
+    root: Path = field(converter=Path, default=CACHE_DIR)
+
+    def path(self, request_body: dict) -> Path:
+        canonical = json.dumps(request_body, sort_keys=True, separators=(",", ":"))
+        return self.root / f"{hashlib.sha256(canonical.encode()).hexdigest()}.json"
+
+    def get(self, request_body: dict) -> Optional[dict]:
+        if not is_cacheable(request_body):
+            return None
+        try:
+            return json_io.loads(self.path(request_body).read_bytes())
+        except FileNotFoundError:
+            return None
+
+    def set(self, request_body: dict, response: dict) -> None:
+        if not is_cacheable(request_body):
+            return
+        path = self.path(request_body)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(json_io.dumps(response))
 
 
 def init_parsers(parser: argparse.ArgumentParser) -> None:
@@ -56,9 +121,21 @@ def init_parsers(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "--output-file",
         "-o",
-        default=sys.stdout,
+        default=sys.stdout.buffer,
         help="Output file to write the API response to",
-        type=argparse.FileType("w", encoding="UTF-8"),
+        # responses are written as JSON bytes, so buffer them in large chunks
+        type=argparse.FileType("wb", bufsize=OUTPUT_BUFFER_SIZE),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=CACHE_DIR,
+        help="Directory to cache report responses in",
+        type=Path,
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse cached responses to requests for past date ranges, and cache new ones",
     )
     parser.add_argument(
         "--debug",
@@ -82,28 +159,63 @@ def get_cli_opts() -> argparse.Namespace:
 def read_json_input(body: io.TextIOWrapper) -> Iterator[dict]:
     """Produce a stream of JSON report requests from CLI args
 
-    This attempts to read the input file as a JSONL, or if that fails, then as a
-    JSON file. Each found input is yielded one at a time.
+    This attempts to read the input file as a JSONL, or if its first line isn't
+    a complete JSON document, then as a JSON file. JSONL inputs are streamed,
+    with each found input yielded one at a time as it's read.
     """
-    lines = [line for line in body]
+    lines = getattr(body, "buffer", body)
+    first = lines.readline()
+    while first and not first.strip():
+        first = lines.readline()
+    if not first:
+        return
     try:
-        yield from (json.loads(line) for line in lines)
+        request_body = json_io.loads(first)
     except json.JSONDecodeError:
-        yield json.loads("\n".join(lines))
+        yield json_io.loads(first + lines.read())
+        return
+
+    yield request_body
+    yield from (json_io.loads(line) for line in lines if line.strip())
+
+
+SAMPLING_KEYS = frozenset({"samplingSpaceSizes", "samplesReadCounts"})
+
+
+def sampling_counts(response: dict) -> Optional[tuple[int, int]]:
+    """Returns the sampling space size & samples read of a sampled response
+
+    The counts are taken from the first sampled report, in the same pass that
+    checks for sampling. Only the keys of each report's data are probed; the
+    rows are never read. Returns None if the response isn't sampled.
+    """
+    for report in response["reports"]:
+        data = report["data"]
+        if not SAMPLING_KEYS.isdisjoint(data):
+            return int(data["samplingSpaceSizes"][0]), int(data["samplesReadCounts"][0])
+    return None
 
 
 def has_sampling(response: dict) -> bool:
     """Check response for sampling"""
-    for report in response["reports"]:
-        if (
-            "samplingSpaceSizes" in report["data"]
-            or "samplesReadCounts" in report["data"]
-        ):
-            return True
-    return False
+    return sampling_counts(response) is not None
 
 
-def split_request(request_body: dict, response: dict):
+def with_date_ranges(request_body: dict, date_ranges: list[dict]) -> dict:
+    """Copy a request body, replacing the date ranges of each report request
+
+    Only the containers along the path to the date ranges are copied, and
+    everything else is shared with the original request body.
+    """
+    return request_body | {
+        "reportRequests": [
+            request | {"dateRanges": date_ranges}
+            for request in request_body["reportRequests"]
+        ]
+    }
+
+
+def split_request(request_body: dict, num_sessions: int, num_samples: int):
     """Take each date range in the request body and shrink it
 
     This takes into account the number of samples read vs. the sampling space,
@@ -112,8 +224,6 @@ def split_request(request_body: dict, response: dict):
 
     def calculate_samples():
         """Guess # of intervals required to fix sampled request"""
-        num_sessions = int(response["reports"][0]["data"]["samplingSpaceSizes"][0])
-        num_samples = int(response["reports"][0]["data"]["samplesReadCounts"][0])
         num_intervals = math.ceil(num_sessions / num_samples * 4 / 3)
         sampling = {
             "sessions": num_sessions,
@@ -127,21 +237,23 @@ def split_request(request_body: dict, response: dict):
         interval_groups = []
         for date_range in request_body["reportRequests"][0]["dateRanges"]:
             # Format: {startDate: str, endDate: str}
-            start = date.fromisoformat(date_range["startDate"])
-            end = date.fromisoformat(date_range["endDate"])
-            temp = (end - start + timedelta(days=1)) / num_intervals
-            interval_len = timedelta(days=(temp.days + (temp.seconds > 0)))
-
-            intervals = []
-            for i in range(0, num_intervals - 1):
-                int_end = start + interval_len - timedelta(days=1)
-                intervals.append(
-                    {"startDate": start.isoformat(), "endDate": int_end.isoformat()}
-                )
-                start += interval_len
-            intervals.append(
-                {"startDate": start.isoformat(), "endDate": end.isoformat()}
-            )
+            # Work in day ordinals, so the interval bounds are plain int math
+            start = date.fromisoformat(date_range["startDate"]).toordinal()
+            end = date.fromisoformat(date_range["endDate"]).toordinal()
+            # Round up, so that the intervals cover the whole date range
+            interval_len = -(-(end - start + 1) // num_intervals)
+
+            # Keep the bounds as columns of ordinals, and only build the date
+            # range dicts once they're all known
+            starts = range(start, start + num_intervals * interval_len, interval_len)
+            ends = [*(int_start - 1 for int_start in starts[1:]), end]
+            intervals = [
+                {
+                    "startDate": date.fromordinal(int_start).isoformat(),
+                    "endDate": date.fromordinal(int_end).isoformat(),
+                }
+                for int_start, int_end in zip(starts, ends)
+            ]
             interval_groups.append(intervals)
         return interval_groups
 
@@ -149,45 +261,165 @@ def split_request(request_body: dict, response: dict):
     interval_groups = generate_intervals(request_body, num_intervals)
     new_date_ranges = zip(*interval_groups)
     for date_range_group in new_date_ranges:
-        # copy required here to ensure that separate retry attempts don't
-        # overwrite each other's date ranges
-        rb = deepcopy(request_body)
-        for request in rb["reportRequests"]:
-            request["dateRanges"] = list(date_range_group)
-        yield rb
+        yield with_date_ranges(request_body, list(date_range_group))
+
+
+@cache
+def get_services():
+    """Returns the authorized services, which are only set up on first use
+
+    Authenticating & loading the discovery document is skipped entirely when
+    the command line arguments are invalid, or help is requested.
+    """
+    # Lazy load expensive module
+    from google_auth import Services
+    return Services.from_auth_context("GoogleAds")
+
+
+def drain(queue: deque) -> Iterator:
+    """Pop items off the front of a queue until it's empty"""
+    while queue:
+        yield queue.popleft()
+
+
+def packing_key(request_body: dict) -> bytes:
+    """Returns the parts of a request body which must match to share a batchGet
+
+    Every report request in a batchGet must have the same view, date ranges,
+    sampling level, segments & cohort group.
+    """
+    first = request_body["reportRequests"][0]
+    return json_io.dumps(
+        [
+            {key: value for key, value in request_body.items() if key != "reportRequests"},
+            [first.get(key) for key in SHARED_REQUEST_KEYS],
+        ]
+    )
+
+
+def pack_requests(request_bodies: Iterable[dict]) -> Iterator[list[dict]]:
+    """Group request bodies which can be sent together as a single batchGet
+
+    Each group holds at most MAX_REPORT_REQUESTS report requests in total.
+    Request bodies which can't share a batchGet with any others are yielded
+    on their own.
+    """
+    groups: dict[bytes, list[dict]] = {}
+    sizes: dict[bytes, int] = {}
+    for request_body in request_bodies:
+        key = packing_key(request_body)
+        size = len(request_body["reportRequests"])
+        if sizes.get(key, 0) + size > MAX_REPORT_REQUESTS and key in groups:
+            del sizes[key]
+            yield groups.pop(key)
+        groups.setdefault(key, []).append(request_body)
+        sizes[key] = sizes.get(key, 0) + size
+    yield from groups.values()
+
+
+def execute_request(services, request_bodies: list[dict]) -> list[dict]:
+    """Send a group of packed report requests from a worker thread
+
+    The reports in the response are split back out, so that there's one
+    response for each of the request bodies.
+    """
+    from google_auth import send_request
+
+    body = request_bodies[0] | {
+        "reportRequests": [
+            request
+            for request_body in request_bodies
+            for request in request_body["reportRequests"]
+        ]
+    }
+    request = services.analytics_service.reports().batchGet(body=body)
+    request.http = services.thread_http
+    response = send_request(request)
+
+    reports = response["reports"]
+    responses = []
+    offset = 0
+    for request_body in request_bodies:
+        size = len(request_body["reportRequests"])
+        responses.append(response | {"reports": reports[offset:offset + size]})
+        offset += size
+    return responses
 
 
 def execute_api_queries(
-    input_file: io.TextIOWrapper, output_file: io.TextIOWrapper, DEBUGGING: bool = False
+    input_file: io.TextIOWrapper,
+    output_file: io.BufferedWriter,
+    DEBUGGING: bool = False,
+    cache: Optional[ResponseCache] = None,
 ):
-    queue = read_json_input(input_file)
-    try:
+    """Send every report request in the input, splitting up sampled requests
+
+    Compatible request bodies are packed together into a single batchGet, and
+    requests are sent concurrently, so responses are written in the order that
+    they complete, rather than the order of the input. Each response includes
+    the request it was made for.
+
+    If a cache is given, requests with a cached response aren't sent, and
+    unsampled responses are added to the cache.
+    """
+    requests = read_json_input(input_file)
+    # split requests are sent once the input is exhausted, as they're queued
+    retries: deque[dict] = deque()
+    pending: dict[Future, list[dict]] = {}
+    # Build the service before starting the worker threads, so they share it
+    services = get_services()
+    services.analytics_service
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         while True:
-            request_body = next(queue)
-            request = service.reports().batchGet(body=request_body)
-            response = send_request(request)
-
-            if has_sampling(response):
-                bad_req = deepcopy(request_body)
-                logging.debug(
-                    "SAMPLED RESPONSE: "
-                    + str(request_body["reportRequests"][0]["dateRanges"])
-                )
-                if DEBUGGING:
-                    print(
-                        "ADD TO QUEUE"
+            ready: list[tuple[dict, dict]] = []
+            unsent: list[dict] = []
+            queue = chain(requests, drain(retries))
+            for request_body in islice(queue, MAX_PENDING - len(pending)):
+                response = None if cache is None else cache.get(request_body)
+                if response is None:
+                    unsent.append(request_body)
+                else:
+                    ready.append((request_body, response))
+            for group in pack_requests(unsent):
+                pending[executor.submit(execute_request, services, group)] = group
+            if not pending and not ready:
+                break
+
+            # don't block on the requests in flight if cached responses are ready
+            done, _ = wait(
+                pending, timeout=0 if ready else None, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                group = pending.pop(future)
+                for request_body, response in zip(group, future.result()):
+                    if cache is not None and sampling_counts(response) is None:
+                        cache.set(request_body, response)
+                    ready.append((request_body, response))
+
+            for request_body, response in ready:
+                counts = sampling_counts(response)
+                if counts is not None:
+                    logging.debug(
+                        "SAMPLED RESPONSE: "
                         + str(request_body["reportRequests"][0]["dateRanges"])
                     )
-                    bad_resp = deepcopy(response)
-                    bad_resp["request"] = bad_req
-                    json.dump(bad_resp, output_file)
-                queue = chain(queue, split_request(bad_req, deepcopy(response)))
-            else:
-                response["request"] = request_body
-                json.dump(response, output_file)
-                output_file.write("\n")
-    except StopIteration:
-        pass
+                    if DEBUGGING:
+                        # stdout's text layer is flushed separately from the
+                        # response output, so debug lines go to stderr
+                        print(
+                            "ADD TO QUEUE"
+                            + str(request_body["reportRequests"][0]["dateRanges"]),
+                            file=sys.stderr,
+                        )
+                        # the response is discarded afterwards, so a
+                        # shallow copy is enough to attach the request to it
+                        json_io.write_line(
+                            response | {"request": request_body}, output_file
+                        )
+                    retries.extend(split_request(request_body, *counts))
+                else:
+                    response["request"] = request_body
+                    json_io.write_line(response, output_file)
 
 
 def main_v1(
@@ -203,6 +435,8 @@ def main_v1(
 
 
 def execute(query: uar.UARequestBatch) -> dict[str, Any]:
+    from google_auth import send_request
+
     for request in query.to_request:
         response = send_request(request)
         if has_sampling(response):
@@ -218,4 +452,7 @@ if __name__ == "__main__":
     if cmd_args.use_new_query_format:
         pass
     else:
-        execute_api_queries(cmd_args.body, cmd_args.output_file, cmd_args.debug)
+        cache = ResponseCache(cmd_args.cache_dir) if cmd_args.cache else None
+        execute_api_queries(
+            cmd_args.body, cmd_args.output_file, cmd_args.debug, cache
+        )
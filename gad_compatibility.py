@@ -1,22 +1,110 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
 from itertools import chain
-from functools import reduce
-from typing import Iterable
-from google_auth import Services
-
-serv = Services.from_auth_context('GoogleAds').ads_client().get_service('GoogleAdsFieldService')
-
-def field_compatibility(field_name: str, is_entity_type: bool, service=serv) -> set[str]:
-    resp = serv.get_google_ads_field(resource_name=f"googleAdsFields/{field_name}")
+from collections import defaultdict
+from functools import cache
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+import json_io
+
+# The Google Ads field schema rarely changes, so field lookups are cached
+CACHE_DIR = Path.home() / ".cache/gad_fields"
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+@cache
+def get_service():
+    """Returns the Google Ads field service, which is only set up on first use"""
+    # Lazy load expensive module
+    from google_auth import Services
+    ads_client = Services.from_auth_context('GoogleAds').ads_client()
+    return ads_client.get_service('GoogleAdsFieldService')
+
+def read_cached_field(field_name: str) -> Optional[dict[str, list[str]]]:
+    """Returns a field's cached lists of compatible fields, if still fresh"""
+    path = CACHE_DIR / f"{field_name}.json"
+    try:
+        if time.time() - path.stat().st_mtime < CACHE_MAX_AGE:
+            return json_io.loads(path.read_bytes())
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        # a corrupt cache file is just looked up again
+        logging.warning("Ignoring unreadable cache file %s", path)
+    return None
+
+def write_cached_field(field_name: str, field: dict[str, list[str]]) -> None:
+    """Cache a field's lists of compatible fields
+
+    The file is written under a temporary name, then moved into place, so a
+    run that's killed mid-write never leaves a truncated cache file behind.
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=CACHE_DIR, suffix=".tmp", delete=False
+    ) as tmp:
+        tmp.write(json_io.dumps(field))
+    os.replace(tmp.name, CACHE_DIR / f"{field_name}.json")
+
+def fetch_fields(
+    field_names: Sequence[str], service=None, refresh: bool = False
+) -> dict[str, dict[str, list[str]]]:
+    """Returns the lists of fields compatible with each Google Ads field
+
+    Each field's lists are cached on disk for CACHE_MAX_AGE seconds, unless a
+    refresh is requested. Every field that isn't cached is looked up with a
+    single search query, and the service is only set up if there are any.
+    Fields that the search doesn't return are logged, and left out.
+    """
+    field_names = list(field_names)
+    fields = {}
+    for field_name in field_names:
+        field = None if refresh else read_cached_field(field_name)
+        if field is not None:
+            fields[field_name] = field
+    missing = [name for name in field_names if name not in fields]
+    if not missing:
+        return fields
+
+    if service is None:
+        service = get_service()
+    names = ", ".join(f"'{name}'" for name in missing)
+    query = f"SELECT name, selectable_with, segments, metrics WHERE name IN ({names})"
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for row in service.search_google_ads_fields(request={'query': query}):
+        field = {
+            'selectable_with': list(row.selectable_with),
+            'segments': list(row.segments),
+            'metrics': list(row.metrics),
+        }
+        write_cached_field(row.name, field)
+        fields[row.name] = field
+    unknown = [name for name in missing if name not in fields]
+    if unknown:
+        logging.warning("No Google Ads field found for: %s", ", ".join(unknown))
+    return fields
+
+def field_compatibility(field: dict[str, list[str]], is_entity_type: bool) -> set[str]:
     if is_entity_type:
-        return set(resp.segments).union(resp.metrics)
-    return set(resp.selectable_with)
+        return set(field['segments']).union(field['metrics'])
+    return set(field['selectable_with'])
 
 def set_intersection(collection: Iterable[set]) -> set:
-    """Return the intersection of all sets in the collection"""
-    def _intersect(acc: set, el: set) -> set:
-        return acc.intersection(el)
+    """Return the intersection of all sets in the collection
 
-    return reduce(_intersect, collection)
+    Starts from the smallest set, so the running intersection stays small.
+    """
+    smallest, *others = sorted(collection, key=len)
+    return smallest.intersection(*others)
+
+def bucket_fields(fields: Iterable[str]) -> dict[str, list[str]]:
+    """Group field names by resource (e.g. 'metrics'), each group sorted"""
+    buckets: dict[str, list[str]] = defaultdict(list)
+    for field_name in sorted(fields):
+        buckets[field_name.split('.', 1)[0]].append(field_name)
+    return buckets
 
 def initcap(instr: str):
     return instr[0].upper() + instr[1:].lower()
@@ -37,13 +125,29 @@ def format_output(table_name: str, field_type: str, field_name: str) -> str:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="List the Google Ads fields compatible with each table")
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Look up every field again, rather than using cached lookups")
+    cmd_args = parser.parse_args()
+
     entities = {'customer', 'campaign', 'ad_group', 'video'}
     segments = {'date', 'hour', 'device', 'ad_network_type', 'slot', 'ad_destination_type', 'click_type'}
 
+    lookups = dict(chain(
+        ((entity, (entity, True)) for entity in entities),
+        ((segment, (f"segments.{segment}", False)) for segment in segments)))
+    fields = fetch_fields(
+        [field_name for field_name, _ in lookups.values()],
+        refresh=cmd_args.refresh_cache)
+    unknown = [name for name, _ in lookups.values() if fields.get(name) is None]
+    if unknown:
+        parser.error(f"Unknown Google Ads field(s): {', '.join(unknown)}")
     compat_dict = {
-        entity: field_compatibility(entity, True) for entity in entities
-    } | {
-        segment: field_compatibility(f"segments.{segment}", False) for segment in segments
+        key: field_compatibility(fields[field_name], is_entity_type)
+        for key, (field_name, is_entity_type) in lookups.items()
     }
 
     attr_table_keys = {
@@ -60,19 +164,21 @@ if __name__ == "__main__":
 
     print("Table Name\tField Type\tGAD Field Name\tGAD Field Ref")
     for table_name in attr_table_keys:
-        fields = set_intersection(compat_dict[el] for el in attr_table_keys[table_name])
+        fields = bucket_fields(
+            set_intersection(compat_dict[el] for el in attr_table_keys[table_name]))
         for entity in attr_table_keys[table_name]:
-            for field_name in sorted(filter(lambda name: name.startswith(entity), fields)):
+            for field_name in fields[entity]:
                 print(format_output(table_name, "Attribute", f"{entity}.field_name"))
 
 
     for table_name in data_table_keys:
-        fields = set_intersection(compat_dict[el] for el in data_table_keys[table_name])
+        fields = bucket_fields(
+            set_intersection(compat_dict[el] for el in data_table_keys[table_name]))
         for field_name in data_table_keys[table_name]:
             if field_name in entities:
                 print(format_output(table_name, "Attribute", f"{field_name}.resource_name"))
             else:
                 print(format_output(table_name, "Segment", f"segments.{field_name}"))
-        for field_name in sorted(filter(lambda name: name.startswith('metrics.'), fields)):
+        for field_name in fields['metrics']:
             if not field_name.startswith('metrics.auction_insight'):
                 print(format_output(table_name, "Metric", field_name))
@@ -1,9 +1,28 @@
 import argparse
-from google_auth import Services
+from functools import cache
+
+
+@cache
+def get_services():
+    """Returns the authorized services, which are only set up on first use
+
+    Holding on to the one session means the client & services built from it
+    are shared, rather than each being set up from scratch.
+    """
+    # Lazy load expensive module
+    from google_auth import Services
+    return Services.from_auth_context('GoogleAds')
+
+
+def get_client():
+    """Returns the Google Ads API client"""
+    return get_services().ads_client()
+
+
+def get_gads():
+    """Returns the Google Ads query service"""
+    return get_services().ads_service('GoogleAdsService')
 
-serv = Services.from_auth_context('GoogleAds')
-client = serv.ads_client
-gads = serv.ads_service('GoogleAdsService')
 
 def init_parsers(parser: argparse.ArgumentParser) -> None:
     """Command line argument parser
@@ -1,34 +1,42 @@
 """Module for requesting authenticated service objects"""
-import pickle
-import json
-import yaml
+import re
+import atexit
+import hashlib
 import time
 import random
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from enum import Enum
 from pathlib import PosixPath
-from functools import cache, cached_property, wraps
-from collections.abc import Iterable
+from types import MappingProxyType
+from functools import cached_property, wraps, lru_cache
+from collections.abc import Iterable, Iterator, Mapping
 from typing import Optional, NewType, TYPE_CHECKING, cast, ClassVar, Callable, \
     TypeVar, NamedTuple, Any
 from warnings import warn
 
-from attrs import define, field, frozen
-from google.auth.exceptions import RefreshError
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from attrs import define, field, frozen, Factory
+
+import json_io
 
 if TYPE_CHECKING:
+    from googleapiclient.errors import HttpError
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import InstalledAppFlow
     from google.auth.transport.requests import Request
 
 
-__all__ = ('Services', 'send_request')
+__all__ = ('Services', 'send_request', 'get_limiter')
 
 GOOGLE_ADS_API_VERSION = 'v14'
 RefreshToken = NewType('RefreshToken', str)
 T = TypeVar('T')
-default_scopes = {
+DEFAULT_SCOPES: frozenset[str] = frozenset({
     'https://www.googleapis.com/auth/adwords',
     'https://www.googleapis.com/auth/analytics',
     'https://www.googleapis.com/auth/analytics.edit',
@@ -37,7 +45,23 @@ default_scopes = {
     'https://www.googleapis.com/auth/tagmanager.edit.containerversions',
     'https://www.googleapis.com/auth/tagmanager.manage.users',
     'https://www.googleapis.com/auth/content'
-}
+})
+
+RATE_LIMIT_ERRORS = frozenset({
+    'userRateLimitExceeded',
+    'quotaExceeded',
+    'rateLimitExceeded',
+})
+RETRYABLE_ERRORS = RATE_LIMIT_ERRORS | {'internalServerError', 'backendError'}
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 20.0
+# reset headers larger than this are epoch timestamps, not wait times
+EPOCH_THRESHOLD = 1e9
+REFRESH_TOKEN_LINE = re.compile(r'^refresh_token:.*$', re.MULTILINE)
+# Google refresh tokens (1//...) which YAML reads back as strings unquoted.
+# The slash rules out values which would load as numbers, bools or nulls
+PLAIN_SCALAR = re.compile(r'[\w.-]*/[\w./-]*')
 
 
 class ApiDataTuple(NamedTuple):
@@ -57,36 +81,96 @@ class ClientSecret(PosixPath):
     """Binds standard auth token I/O methods to the auth token's Path"""
     def write_refresh(self, refresh_token: RefreshToken) -> None:
         """Add / Overwrite refresh token in token file"""
-        with self.open('r') as f:
-            data = json.load(f)
-
-        with self.open('w') as f:
-            data['installed']['refresh_token'] = refresh_token
-            json.dump(data, f)
+        data = json_io.loads(self.read_bytes())
+        data['installed']['refresh_token'] = refresh_token
+        self.write_bytes(json_io.dumps(data))
 
 
 class GoogleAdsToken(PosixPath):
     """Binds standard auth token I/O methods to the auth token's Path"""
     def write_refresh(self, refresh_token: RefreshToken) -> None:
-        """Add / Overwrite refresh token in token file"""
+        """Add / Overwrite refresh token in token file
+
+        The refresh token is a top level key, so its line is patched in place
+        where possible. Otherwise the file is round-tripped through YAML.
+        """
+        if PLAIN_SCALAR.fullmatch(refresh_token):
+            text = self.read_text()
+            patched, count = REFRESH_TOKEN_LINE.subn(
+                lambda _: f'refresh_token: {refresh_token}', text, count=1)
+            if count:
+                self.write_text(patched)
+                return
+
+        # Lazy load expensive module
+        import yaml
+        # Use the libyaml bindings where they're available
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
         with self.open('r') as f:
-            data = yaml.load(f, Loader=yaml.SafeLoader)
+            data = yaml.load(f, Loader=loader)
 
         with self.open('w') as f:
             data['refresh_token'] = refresh_token
-            yaml.dump(data, f)
+            yaml.dump(data, f, Dumper=dumper)
+
+
+@define
+class DiscoveryFileCache:
+    """File-backed cache for discovery documents fetched over the network
+
+    Implements the get / set interface googleapiclient expects of a discovery
+    document cache. Cached documents expire after max_age seconds.
+    """
+    root: PosixPath = field(
+        converter=PosixPath,
+        default=PosixPath.home() / '.cache/google_auth/discovery')
+    max_age: int = field(default=24 * 60 * 60)
+
+    def path(self, url: str) -> PosixPath:
+        return self.root / f"{hashlib.sha1(url.encode()).hexdigest()}.json"
+
+    def get(self, url: str) -> Optional[str]:
+        path = self.path(url)
+        try:
+            if time.time() - path.stat().st_mtime < self.max_age:
+                return path.read_text()
+        except FileNotFoundError:
+            pass
+        return None
+
+    def set(self, url: str, content: str) -> None:
+        path = self.path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def fetch_discovery_doc(api: ApiDataTuple) -> None:
+    """Fetch an API's discovery document into the discovery file cache
+
+    Discovery documents are public, so this uses its own unauthorized
+    transport, which makes it safe to call from any thread.
+    """
+    # Lazy load expensive module
+    from googleapiclient.discovery import build
+    from googleapiclient.http import build_http
+    build(
+        api.api_name, api.version, http=build_http(),
+        static_discovery=False, cache=DiscoveryFileCache())
 
 
 def attempt(
     fn: Callable[..., T],
-    recoverableErrors: tuple[Exception, ...],
+    recoverableErrors: Iterable[type[BaseException]],
     fallback: Callable[..., T]
 ) -> Callable[..., T]:
+    recoverable = tuple(recoverableErrors)
+
     @wraps(fn)
     def inner(*args, **kwargs) -> T:
         try:
             return fn(*args, **kwargs)
-        except tuple(recoverableErrors): # type: ignore[misc]
+        except recoverable:
             return fallback(*args, **kwargs)
 
     return inner
@@ -116,6 +200,43 @@ class Context:
             PosixPath.home() / ddict['data'].get('google_ads_yaml_path', None))
 
 
+@lru_cache(maxsize=32)
+def read_token_info(token_path: PosixPath, mtime_ns: int) -> Mapping[str, Any]:
+    """Read the stored credentials' data from a token file
+
+    Credentials are stored as JSON. Token files from before that change
+    hold pickled credentials, and are rewritten as JSON once read. The parsed
+    data is shared by every AuthRoot using the token file, for as long as its
+    modification time is unchanged, so it's returned read-only.
+    """
+    data = token_path.read_bytes()
+    try:
+        info = json_io.loads(data)
+    except ValueError:
+        import pickle
+        try:
+            credentials = pickle.loads(data)
+        except (pickle.UnpicklingError, EOFError) as error:
+            raise ValueError("Unreadable token file") from error
+        text = credentials.to_json()
+        token_path.write_text(text)
+        info = json_io.loads(text)
+    return MappingProxyType(info)
+
+
+def read_credentials(token_path: PosixPath) -> 'Credentials':
+    """Build credentials from the data stored in a token file
+
+    Refreshing credentials updates them in place, so every caller gets its
+    own Credentials object, and only the file's parsed data is shared.
+    """
+    # Lazy load expensive module
+    from google.oauth2.credentials import Credentials
+
+    info = read_token_info(token_path, token_path.stat().st_mtime_ns)
+    return Credentials.from_authorized_user_info(info, scopes=info.get('scopes'))
+
+
 @define
 class AuthRoot:
     """Storage container for WD account scoped auth info
@@ -123,7 +244,7 @@ class AuthRoot:
     This class handles auth token management for any given WD account.
     It requires the following file paths:
         clientSecrets: the JSON file from Google Cloud Console
-        token: the path to the pickled credentials. If they don't exist
+        token: the path to the stored credentials. If they don't exist
             yet, name the path where they should be stored once created.
         adsAuth: the YAML file downloaded from Google Ads
 
@@ -136,8 +257,13 @@ class AuthRoot:
     """
     wd_acct_name: str
     context: Context
-    scopes: set[str] = field(default=default_scopes)
+    scopes: frozenset[str] = field(default=DEFAULT_SCOPES, converter=frozenset)
     credential_store: 'Credentials' = field(init=False)
+    # the credential store's scopes, kept as a set for quick subset checks
+    granted_scopes: frozenset[str] = field(init=False, default=frozenset())
+    # the requested scopes, in the list form the OAuth flow expects
+    scope_list: list[str] = field(
+        init=False, default=Factory(lambda self: sorted(self.scopes), takes_self=True))
 
     def write_refresh_token(self, refresh_token: RefreshToken) -> None:
         """Posts the refresh token to all auth token files"""
@@ -153,16 +279,19 @@ class AuthRoot:
 
         Checks the following places (in order):
             - Valid Credentials object already exists on self
-            - Valid pickled credentials object
-            - Expired pickled credentials that can be refreshed
+            - Valid stored credentials
+            - Expired stored credentials that can be refreshed
             - Build credentials from client secret file data
         """
+        # Lazy load expensive module
+        from google.auth.exceptions import RefreshError
+
         if force_refresh:
             self.build_credentials()
-            self.context.token_path.write_bytes(pickle.dumps(self.credential_store))
+            self.save_credentials()
         elif not self.credentials_valid:
             try:
-                self.credential_store = pickle.loads(self.context.token_path.read_bytes())
+                self.set_credentials(self.load_credentials())
                 assert self.credentials_valid
             except (AssertionError, AttributeError):
                 try:
@@ -170,12 +299,25 @@ class AuthRoot:
                 except (AttributeError, AssertionError, RefreshError):
                     self.build_credentials()
                 finally:
-                    self.context.token_path.write_bytes(pickle.dumps(self.credential_store))
-            except (FileNotFoundError, RefreshError):
+                    self.save_credentials()
+            except (FileNotFoundError, ValueError, RefreshError):
                 self.build_credentials()
-                self.context.token_path.write_bytes(pickle.dumps(self.credential_store))
+                self.save_credentials()
         return self.credential_store
 
+    def load_credentials(self) -> 'Credentials':
+        """Read the stored credentials from the token file"""
+        return read_credentials(self.context.token_path)
+
+    def set_credentials(self, credentials: 'Credentials') -> None:
+        """Store the credentials, along with the scopes they grant"""
+        self.credential_store = credentials
+        self.granted_scopes = frozenset(credentials.scopes or ())
+
+    def save_credentials(self) -> None:
+        """Write the credentials to the token file"""
+        self.context.token_path.write_text(self.credential_store.to_json())
+
     def try_refresh(self) -> None:
         """Attempts to refresh the auth token"""
         assert self.credentials_refreshable
@@ -189,8 +331,8 @@ class AuthRoot:
         # Lazy load expensive module
         from google_auth_oauthlib.flow import InstalledAppFlow
         flow = InstalledAppFlow.from_client_secrets_file(
-            self.context.client_secret_path, scopes=list(self.scopes))
-        self.credential_store = flow.run_local_server(port=0)
+            self.context.client_secret_path, scopes=self.scope_list)
+        self.set_credentials(flow.run_local_server(port=0))
         assert self.credentials_valid
         self.write_refresh_token(
             cast(RefreshToken, self.credential_store.refresh_token))
@@ -200,7 +342,7 @@ class AuthRoot:
         """Check credentials for validity and sufficient scope"""
         return hasattr(self, 'credential_store') and \
             self.credential_store.valid and \
-            self.scopes.issubset(self.credential_store.scopes)
+            self.scopes <= self.granted_scopes
 
     @property
     def credentials_refreshable(self):
@@ -208,7 +350,7 @@ class AuthRoot:
         return hasattr(self, 'credential_store') and \
             self.credential_store.expired and \
             self.credential_store.refresh_token and \
-            self.scopes.issubset(self.credential_store.scopes)
+            self.scopes <= self.granted_scopes
 
     def check_scopes(self, scopes: set[str]) -> bool:
         return True
@@ -221,13 +363,17 @@ class AuthRoot:
         """
 
 
-def first(condition: Callable[[T], bool], iterable: Iterable[T]) -> T:
-    """Returns the first item in an iterable matching the condition
+@lru_cache(maxsize=4)
+def load_contexts(
+    context_file_path: PosixPath, mtime_ns: int
+) -> dict[str, dict]:
+    """Returns the contexts listed in an auth config file, keyed by owner
 
-    If the condition is not satisfied by any item in the iterable, it raises
-    a StopIteration error.
+    The parsed contexts are reused for as long as the file's modification
+    time is unchanged. They're shared between callers, so don't mutate them.
     """
-    return next(filter(condition, iterable))
+    contexts = json_io.loads(context_file_path.read_bytes())
+    return {context['owner']: context for context in contexts}
 
 
 class Services:
@@ -237,8 +383,14 @@ class Services:
     for the provided credentials. Those tokens are then bound to API service
     objects to make authenticated requests to various Google APIs.
     """
-    # Flyweight pattern to cache authorized sessions on a per-account level
-    contexts: ClassVar[dict[str, 'Services']] = {}
+    # Flyweight pattern to cache authorized sessions per account & scopes.
+    # Sessions are dropped once nothing else holds on to them
+    contexts: ClassVar[weakref.WeakValueDictionary[
+        tuple[str, frozenset[str]], 'Services']] = weakref.WeakValueDictionary()
+    # Built discovery services, shared by every session with the same
+    # credentials. Services only reference their transport, so they don't keep
+    # the sessions which built them alive
+    _discovery_cache: ClassVar[dict[tuple[str, ApiDataTuple], Any]] = {}
 
     def __init__(
         self,
@@ -246,12 +398,41 @@ class Services:
         context_owner: Optional[str] = None,
         force_refresh: bool = False
     ) -> None:
-        self._creds = auth_root.credentials(force_refresh=force_refresh)
+        self._auth_root = auth_root
+        self._force_refresh = force_refresh
         self._ads_path = auth_root.context.ads_auth_path
         if context_owner is None:
             context_owner = auth_root.wd_acct_name
-        self.__class__.contexts[context_owner] = self
-        self.services: dict[ApiDataTuple, Any] = {}
+        self.__class__.contexts[(context_owner, auth_root.scopes)] = self
+        # Client caches are kept on the instance, so they don't keep it alive
+        self._ads_clients: dict[str, Any] = {}
+        self._ads_services: dict[tuple[str, str], Any] = {}
+        self._ga4_services: dict[str, Any] = {}
+        self._ga4_admin_services: dict[tuple[str, str], Any] = {}
+        self._local = threading.local()
+
+    @cached_property
+    def _creds(self) -> 'Credentials':
+        """Returns the account's credentials, which are only loaded on first use
+
+        The Google Ads client authenticates from its own token file, so
+        sessions that only use it never load or refresh the credentials.
+        """
+        return self._auth_root.credentials(force_refresh=self._force_refresh)
+
+    @cached_property
+    def _creds_key(self) -> str:
+        """Returns a fingerprint of the account & scopes the credentials grant
+
+        Unlike id(), this is the same for every session built from the same
+        stored credentials, and is never reused by other credentials.
+        """
+        identity = '\0'.join([
+            self._creds.client_id or '',
+            self._creds.refresh_token or '',
+            *sorted(self._creds.scopes or ()),
+        ])
+        return hashlib.sha256(identity.encode()).hexdigest()
 
     @classmethod
     def from_auth_context(
@@ -263,69 +444,146 @@ class Services:
     ) -> 'Services':
         """Read the auth token paths in from a json config file"""
 
-        def owner_eq(context: dict[str, str]) -> bool:
-            return context['owner'] == context_owner
-
         # just return the existing credentials if they already exist
-        if context_owner in cls.contexts:
-            return cls.contexts[context_owner]
+        requested_scopes = frozenset(scopes or DEFAULT_SCOPES)
+        services = cls.contexts.get((context_owner, requested_scopes))
+        if services is not None:
+            return services
         context_file = PosixPath(context_file_path)
-        context_data: list[dict] = json.loads(context_file.read_text())
+        contexts = load_contexts(context_file, context_file.stat().st_mtime_ns)
 
         try:
-            context = Context.from_json(first(owner_eq, context_data))
-        except StopIteration:
+            context = Context.from_json(contexts[context_owner])
+        except KeyError:
             raise KeyError(
                 f"Couldn't find context owner {context_owner} in context file")
 
-        aroot = AuthRoot(context.email, context, scopes or default_scopes)
+        aroot = AuthRoot(context.email, context, requested_scopes)
         return cls(aroot, context_owner)
 
-    @cache
     def ads_client(self, version: str = GOOGLE_ADS_API_VERSION):
         """Returns top level Google Ads API interface"""
-        import google.ads.googleads.client as ads
-        return ads.GoogleAdsClient.load_from_storage(self._ads_path, version=version)
+        client = self._ads_clients.get(version)
+        if client is None:
+            import google.ads.googleads.client as ads
+            client = ads.GoogleAdsClient.load_from_storage(
+                self._ads_path, version=version)
+            self._ads_clients[version] = client
+        return client
 
-    @cache
     def ads_service(
         self,
         service_name: str = 'GoogleAdsService',
         version: str = GOOGLE_ADS_API_VERSION
     ):
         """Returns Google Ads performance reporting interface"""
-        return self.ads_client(version=version).get_service(service_name, version=version)
+        service = self._ads_services.get((service_name, version))
+        if service is None:
+            service = self.ads_client(version=version).get_service(
+                service_name, version=version)
+            self._ads_services[(service_name, version)] = service
+        return service
 
-    @cached_property
+    @property
     def ads_customer_service(self):
         """Returns Google Ads customer service"""
-        return self.ads_client.get_service(
-            'CustomerService',
-            version=GOOGLE_ADS_API_VERSION)
+        return self.ads_service('CustomerService')
+
+    @cached_property
+    def http(self):
+        """Returns authorized HTTP transport shared by all discovery services
+
+        httplib2 keeps connections alive per Http object, so sharing a single
+        one lets every request on this account reuse the same warm connection.
+        """
+        return self.new_http()
+
+    @property
+    def thread_http(self):
+        """Returns an authorized HTTP transport for the current thread
+
+        httplib2 isn't thread-safe, so requests sent from worker threads each
+        need their own transport. The main thread uses the shared one.
+        """
+        if threading.current_thread() is threading.main_thread():
+            return self.http
+        if not hasattr(self._local, 'http'):
+            self._local.http = self.new_http()
+        return self._local.http
+
+    def new_http(self):
+        """Returns a new authorized HTTP transport"""
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.http import build_http
+        return AuthorizedHttp(self._creds, http=build_http())
 
     def discovery_service(self, api: ApiDataTuple, version: Optional[str] = None):
-        """Returns authenticated service object for Discovery Document API"""
+        """Returns authenticated service object for Discovery Document API
+
+        Services are bound to the shared transport of the first session to
+        build them. Requests sent from worker threads should be executed with
+        thread_http instead.
+        """
         if version is not None and version != api.version:
             api = ApiDataTuple(api.api_name, version)
-        if api not in self.services:
-            service = build(api.api_name, api.version, credentials=self._creds)
-            self.services[api] = service
-        else:
-            service = self.services[api]
+        service = self._discovery_cache.get((self._creds_key, api))
+        if service is None:
+            # Lazy load expensive module
+            from googleapiclient.discovery import build
+            from googleapiclient.errors import UnknownApiNameOrVersion
+            try:
+                service = build(api.api_name, api.version, http=self.http)
+            except UnknownApiNameOrVersion:
+                # No discovery document ships with the client library for this
+                # API, so fetch it over the network & keep a copy on disk
+                service = build(
+                    api.api_name, api.version, http=self.http,
+                    static_discovery=False, cache=DiscoveryFileCache())
+            self._discovery_cache[(self._creds_key, api)] = service
         return service
 
-    @cache
+    def warmup(self, apis: Iterable[ApiDataTuple]) -> None:
+        """Build several discovery services at once
+
+        Discovery documents that don't ship with the client library are each
+        fetched over the network, so fetching them concurrently means waiting
+        on the slowest one rather than all of them in turn. Only the documents
+        are fetched from worker threads; the services are built on this thread,
+        so that they're all bound to the shared transport.
+        """
+        # Lazy load expensive module
+        from googleapiclient.discovery_cache import get_static_doc
+
+        apis = [
+            api for api in apis
+            if (self._creds_key, api) not in self._discovery_cache]
+        remote = [
+            api for api in apis if get_static_doc(api.api_name, api.version) is None]
+        if remote:
+            with ThreadPoolExecutor(max_workers=len(remote)) as executor:
+                # list() so errors raised while fetching are re-raised here
+                list(executor.map(fetch_discovery_doc, remote))
+        for api in apis:
+            self.discovery_service(api)
+
     def ga4_service(self, scope='rw'):
-        from google.analytics.data_v1beta import BetaAnalyticsDataClient
-        return BetaAnalyticsDataClient(credentials=self._creds)
+        service = self._ga4_services.get(scope)
+        if service is None:
+            from google.analytics.data_v1beta import BetaAnalyticsDataClient
+            service = BetaAnalyticsDataClient(credentials=self._creds)
+            self._ga4_services[scope] = service
+        return service
 
-    @cache
     def ga4_admin_service(self, version='v1_beta', scope='rw'):
-        if version == 'v1_beta':
-            from google.analytics.admin_v1beta import AnalyticsAdminServiceClient
-        if version == 'v1_alpha':
-            from google.analytics.admin_v1alpha import AnalyticsAdminServiceClient
-        return AnalyticsAdminServiceClient(credentials=self._creds)
+        service = self._ga4_admin_services.get((version, scope))
+        if service is None:
+            if version == 'v1_beta':
+                from google.analytics.admin_v1beta import AnalyticsAdminServiceClient
+            if version == 'v1_alpha':
+                from google.analytics.admin_v1alpha import AnalyticsAdminServiceClient
+            service = AnalyticsAdminServiceClient(credentials=self._creds)
+            self._ga4_admin_services[(version, scope)] = service
+        return service
 
     @property
     def sheets_service(self):
@@ -353,26 +611,226 @@ class Services:
         return self.discovery_service(DiscoveryServices.MerchantCenter)
 
 
-def send_request(request):
-    """Make API requests with exponential backoff"""
-    retryable_errors = (
-        'userRateLimitExceeded',
-        'quotedExceeded',
-        'internalServerError',
-        'backendError',
-        'rateLimitExceeded',
-        'Too Many Requests')
+def error_reason(error: 'HttpError') -> str:
+    """Returns the API error reason (e.g. 'rateLimitExceeded') of an error
+
+    The reason attached to error.resp is just the HTTP status phrase, so the
+    API-specific reason has to be read out of the response body.
+    """
+    try:
+        content = json_io.loads(error.content)
+        return content['error']['errors'][0]['reason']
+    except (ValueError, TypeError, KeyError, IndexError):
+        return ''
+
+
+def is_retryable(error: 'HttpError') -> bool:
+    """Check whether a failed request is worth retrying"""
+    return error.resp.status in RETRYABLE_STATUSES \
+        or error_reason(error) in RETRYABLE_ERRORS
+
+
+def is_rate_limited(error: 'HttpError') -> bool:
+    """Check whether a request failed because a quota was exceeded"""
+    return error.resp.status == 429 or error_reason(error) in RATE_LIMIT_ERRORS
+
+
+def retry_after(error: 'HttpError') -> Optional[float]:
+    """Returns the wait time (in seconds) requested by the server, if any
+
+    Checks the standard Retry-After header, which may be given either as a
+    number of seconds or as an HTTP date, then falls back to the
+    x-ratelimit-reset header some endpoints send instead. That header is often
+    an epoch timestamp rather than a number of seconds, so large values are
+    treated as the time to wait until. Waits are capped at BACKOFF_CAP.
+    """
+    for header in ('retry-after', 'x-ratelimit-reset'):
+        value = error.resp.get(header)
+        if value is None:
+            continue
+        try:
+            wait = float(value)
+            if wait > EPOCH_THRESHOLD:
+                wait -= time.time()
+        except ValueError:
+            try:
+                wait_until = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                continue
+            wait = (wait_until - datetime.now(timezone.utc)).total_seconds()
+        return min(BACKOFF_CAP, max(0.0, wait))
+    return None
+
+
+@define
+class RequestLimiter:
+    """Client-side congestion control shared by every call to send_request
+
+    Caps the number of requests in flight with an AIMD window: each success
+    grows the window additively, and each throttled response halves it. The
+    rate at which requests are sent is capped the same way, with a token
+    bucket that refills at the current rate. After enough consecutive
+    throttled responses, the circuit opens and no new requests are sent until
+    the server's requested wait time has passed.
+
+    Server errors back off the same way, but only rate limiting says anything
+    about the account's quota. So the quota window & rate, which are what get
+    saved for later runs, only shrink on rate limited responses.
+    """
+    window: float = field(default=8.0)
+    max_window: float = field(default=32.0)
+    rate: float = field(default=10.0)
+    max_rate: float = field(default=50.0)
+    trip_threshold: int = field(default=5)
+    quota_window: float = field(
+        init=False, default=Factory(lambda self: self.window, takes_self=True))
+    quota_rate: float = field(
+        init=False, default=Factory(lambda self: self.rate, takes_self=True))
+    in_flight: int = field(init=False, default=0)
+    sent: int = field(init=False, default=0)
+    tokens: float = field(
+        init=False, default=Factory(lambda self: self.rate, takes_self=True))
+    refilled_at: float = field(init=False, factory=time.monotonic)
+    throttled_streak: int = field(init=False, default=0)
+    open_until: float = field(init=False, default=0.0)
+    _cond: threading.Condition = field(init=False, factory=threading.Condition)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Block until a request may be sent, and hold a place in the window"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                # the bucket holds at most a second's worth of requests
+                self.tokens = min(
+                    self.rate, self.tokens + (now - self.refilled_at) * self.rate)
+                self.refilled_at = now
+                wait = max(
+                    self.open_until - now, (1 - self.tokens) / self.rate)
+                if wait <= 0 and self.in_flight < max(1, int(self.window)):
+                    break
+                self._cond.wait(timeout=wait if wait > 0 else None)
+            self.tokens -= 1
+            self.in_flight += 1
+            self.sent += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def record_success(self) -> None:
+        with self._cond:
+            self.throttled_streak = 0
+            self.window = min(self.max_window, self.window + 1 / self.window)
+            self.rate = min(self.max_rate, self.rate + 0.1)
+            self.quota_window = min(
+                self.max_window, self.quota_window + 1 / self.quota_window)
+            self.quota_rate = min(self.max_rate, self.quota_rate + 0.1)
+            self._cond.notify_all()
+
+    def record_throttle(
+        self, server_wait: Optional[float] = None, rate_limited: bool = True
+    ) -> None:
+        with self._cond:
+            self.throttled_streak += 1
+            self.window = max(1.0, self.window / 2)
+            self.rate = max(1.0, self.rate / 2)
+            if rate_limited:
+                self.quota_window = max(1.0, self.quota_window / 2)
+                self.quota_rate = max(1.0, self.quota_rate / 2)
+            if self.throttled_streak >= self.trip_threshold:
+                wait = BACKOFF_CAP if server_wait is None else server_wait
+                self.open_until = time.monotonic() + wait
+
+    @classmethod
+    def load(cls, path: PosixPath, max_age: int = 60 * 60) -> 'RequestLimiter':
+        """Returns a limiter starting from the state saved by a recent run
+
+        Quotas are shared between runs, so starting from the last run's rate
+        avoids overshooting them all over again on every cold start. Quotas
+        also recover over time, so the saved state decays back towards the
+        defaults, and is ignored entirely once it's max_age seconds old.
+        """
+        default = cls()
+        try:
+            age = time.time() - path.stat().st_mtime
+            if age < max_age:
+                state = json_io.loads(path.read_bytes())
+                kept = 1 - max(0.0, age) / max_age
+                return cls(
+                    window=default.window + (state['window'] - default.window) * kept,
+                    rate=default.rate + (state['rate'] - default.rate) * kept)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return default
+
+    def save(self, path: PosixPath) -> None:
+        """Save the quota rate & window, if any requests have been sent"""
+        with self._cond:
+            if not self.sent:
+                return
+            state = {'window': self.quota_window, 'rate': self.quota_rate}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(json_io.dumps(state))
+
+
+LIMITER_STATE_PATH = PosixPath.home() / '.cache/google_auth/limiter.json'
+_limiter: Optional[RequestLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RequestLimiter:
+    """Returns the limiter shared by every call to send_request
+
+    It's only created when the first request is sent, so importing this
+    module never reads or writes the saved limiter state.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RequestLimiter.load(LIMITER_STATE_PATH)
+            atexit.register(_limiter.save, LIMITER_STATE_PATH)
+        return _limiter
+
+
+def send_request(request) -> Any:
+    """Make API requests with jittered exponential backoff
+
+    If the server tells us how long to wait before retrying, that wait time is
+    used in place of the backoff schedule. Requests are admitted through the
+    shared limiter, so a run that keeps getting throttled slows itself down.
+    """
+    from googleapiclient.errors import HttpError
 
+    limiter = get_limiter()
     max_retries = 6
+    backoff = BACKOFF_BASE
     for n in range(0, max_retries):
         try:
-            return request.execute()
+            with limiter.slot():
+                response = request.execute()
+            limiter.record_success()
+            return response
 
         except HttpError as error:
-            if error.resp.reason in retryable_errors and n < max_retries:
-                time.sleep((2 ** n) + random.random())
+            if is_retryable(error) and n < max_retries - 1:
+                server_wait = retry_after(error)
+                limiter.record_throttle(server_wait, is_rate_limited(error))
+                # decorrelated jitter, so concurrent clients don't retry in sync
+                backoff = min(BACKOFF_CAP, random.uniform(BACKOFF_BASE, backoff * 3))
+                if server_wait is not None:
+                    time.sleep(max(server_wait, random.random()))
+                else:
+                    time.sleep(backoff)
             else:
+                logging.error(
+                    "Request failed after %d attempt(s): %s %s",
+                    n + 1, error.resp.status, error.content[:200])
                 raise error
+    # the loop always returns or raises, this is just here for type checkers
+    raise AssertionError("unreachable")
 
 
 if __name__ == "__main__":
@@ -392,6 +850,12 @@ if __name__ == "__main__":
     serv.ga4_service()
     serv.ga4_admin_service(version='v1_beta')
     serv.ga4_admin_service(version='v1_alpha')
+    serv.warmup([
+        DiscoveryServices.Sheets,
+        DiscoveryServices.UaReporting,
+        DiscoveryServices.UaManagement,
+        DiscoveryServices.TagManager,
+        DiscoveryServices.MerchantCenter])
     serv.sheets_service
     serv.analytics_service
     serv.analytics_management_service
@@ -0,0 +1,47 @@
+"""JSON I/O helpers for the CLI tools
+
+Uses orjson when it's installed, since it's much faster than the standard
+library's json module, and falls back to the standard library otherwise.
+"""
+import json
+from typing import Any, IO
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+
+__all__ = ('loads', 'load', 'dumps', 'write_line')
+
+
+def loads(data: bytes | str) -> Any:
+    """Deserialize a JSON document"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(file: IO) -> Any:
+    """Deserialize a JSON document from a file
+
+    Text files are read through their underlying binary buffer, which skips
+    decoding the file contents into a str before parsing them.
+    """
+    return loads(getattr(file, 'buffer', file).read())
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize an object to a UTF-8 encoded JSON document"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+def write_line(obj: Any, file: IO) -> None:
+    """Write an object to a file as a single line of JSON"""
+    buffer = getattr(file, 'buffer', file)
+    if orjson is not None:
+        buffer.write(orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE))
+    else:
+        buffer.write(dumps(obj) + b"\n")
@@ -1,157 +1,189 @@
 #!/usr/bin/env python
 """Command line tool for making requests to the GA Management API"""
 
-import json
 import argparse
-import time
-import random
 import sys
-from functools import reduce
 from pathlib import Path
-from typing import Literal, Optional
+from typing import Literal, Optional, TYPE_CHECKING
 
-from google_auth import Services, send_request
+import json_io
+import argfiles
+
+if TYPE_CHECKING:
+    from google_auth import Services
 
-service=Services.from_auth_context("GoogleAds").tagmanager_service
 arg_data_path=Path("/Users/stevenmurray/google-apis/discovery/argfiles/tagmanager.json")
+cache_path=Path.home() / ".cache/tagmanager/args.v3.pkl"
 PathArgType = Optional[Literal["path", "parent"]]
+# the comma-separated entity id args of 'folders > move_entities_to_folder'
+MOVE_ENTITY_ARGS = ("tagId", "triggerId", "variableId")
+
+
+def split_entity_ids(cli_args: argparse.Namespace) -> None:
+    """Split the entity id args of 'folders > move_entities_to_folder'
+
+    The 3 "entityId" fields are input as comma-separated strings, and are
+    split into lists, as expected by the client library.
+    """
+    args = vars(cli_args)
+    for arg in MOVE_ENTITY_ARGS:
+        if args[arg] is not None:
+            args[arg] = args[arg].split(",")
+
+
+# Subparser-specific handling of parsed CLI arguments, by endpoint name
+SPECIAL_ARG_HANDLERS = {
+    "move_entities_to_folder": split_entity_ids,
+}
 
-get_invoke = lambda obj, key: getattr(obj, key)()
 
 class ApiPath:
     """API Path aware argument & client library handling"""
-    def __init__(self, service: Services, lib_path: list[str], endpoint: str,
+    def __init__(self, lib_path: tuple[str, ...], endpoint: str,
                  path_var: PathArgType) -> None:
-        """Setup the correct client library object & path variable parser"""
+        """Setup the path variable parser
+
+        The client library object is set up separately, by
+        create_library_function, once the service has been authenticated.
+        """
         self.lib_path = lib_path
         self.path_var = path_var
         self.endpoint = endpoint
-        self.create_library_function(service)
+        self.do_special_arg_handling = SPECIAL_ARG_HANDLERS.get(
+            endpoint, lambda x: None)
         self.prepare_path_parser()
 
-    def create_library_function(self, service: Services) -> None:
-        """Create library function handler"""
-        get_invoke = lambda obj, key: getattr(obj, key)()
-        self.library_function = getattr(
-            reduce(get_invoke, self.lib_path, service), self.endpoint)
+    def create_library_function(self, service: 'Services') -> None:
+        """Create library function handler
+
+        Walks the service's resource tree down to the endpoint, e.g.
+        service.accounts().containers().tags().get
+        """
+        resource = service
+        for resource_name in self.lib_path:
+            resource = getattr(resource, resource_name)()
+        self.library_function = getattr(resource, self.endpoint)
 
     def prepare_path_parser(self):
-        """Build the "parse path" function
+        """Work out which path args to compile into the path variable
 
-        Need to:
-            - Decide whether to trim the libpath
-            - Zip the libPath objects w/ parsed args
+        The path variable names the entity, while the parent variable names
+        the entity it belongs to, so the libpath is trimmed for parents.
         """
-        def parse_path_args(cli_args: argparse.Namespace) -> None:
-            """Compile separate CLI arguments into a single path arg"""
-            mangleName = lambda instr: instr[:-1] + "Id"
-            path_args = [getattr(cli_args, mangleName(arg)) for arg in lib_path]
-            for arg in lib_path:
-                delattr(cli_args, mangleName(arg))
-            path = "/".join("/".join(e) for e in zip(lib_path, path_args))
-            setattr(cli_args, str(self.path_var), path)
-
+        if self.path_var == "parent":
+            self.path_resources = self.lib_path[:-1]
+        else:
+            self.path_resources = self.lib_path
+        # e.g. "accounts" is passed as the "accountId" argument
+        self.id_names = tuple(
+            resource[:-1] + "Id" for resource in self.path_resources)
+
+    def parse_path_args(self, cli_args: argparse.Namespace) -> None:
+        """Compile separate CLI arguments into a single path arg"""
         if self.path_var is None:
-            self.parse_path_args = lambda x: None
             return
-        if self.path_var == "path":
-            lib_path = self.lib_path
-        elif self.path_var == "parent":
-            lib_path = self.lib_path[:-1]
-        self.parse_path_args = parse_path_args
-
-    def do_special_arg_handling(self, cli_args):
-        """Subparser-specific handling of parsed CLI arguments
-
-        Currently, only includes 'folders > move_entities_to_folder' commands.
-        This splits the 3 "entityId" fields, input as comma-separated strings,
-        into lists, as expected by the client library.
-        """
-        if self.endpoint == "move_entities_to_folder":
-            for arg in ["tagId", "triggerId", "variableId"]:
-                argval = getattr(cli_args, arg)
-                if argval is not None:
-                    setattr(cli_args, arg, argval.split(","))
-
-
-type_map = {
-    "string": str,
-    "integer": int,
-    "boolean": bool,
-    "FILE": argparse.FileType('r')
-}
+        args = vars(cli_args)
+        parts = [None] * (2 * len(self.path_resources))
+        parts[0::2] = self.path_resources
+        parts[1::2] = [args.pop(name) for name in self.id_names]
+        args[self.path_var] = "/".join(parts)
+
 
-def parse_arg_data(data_path: Path) -> dict:
-    """Serialize arg data JSON into code
+def prepare_arg_data(arg_data: list[dict]) -> list[dict]:
+    """Record the arguments each endpoint's ApiPath is built from
 
-    In addition to loading the json, this substitutes a couple values in the
-    arg data with functions.
+    The ApiPath is only built for the endpoint that's actually selected.
     """
-    arg_data = json.loads(data_path.read_text())
     for entity in arg_data:
         for endpoint in entity["endpoints"]:
-            endpoint["path_handler"] = ApiPath(
-                service,
-                entity["libraryPath"],
-                endpoint["name"],
-                endpoint["pathVar"])
-            for arg in endpoint["args"]:
-                arg["data"]["type"] = type_map[arg["data"]["type"]]
-                if arg["name"] == "body":
-                    arg["data"]["nargs"] = "?"
-                    arg["data"]["default"] = sys.stdin
+            endpoint["defaults"] = {
+                "path_spec": (
+                    tuple(entity["libraryPath"]),
+                    endpoint["name"],
+                    endpoint["pathVar"]),
+                "has_body": any(
+                    arg["name"] == "body" for arg in endpoint["args"]),
+            }
+            argfiles.prepare_args(endpoint)
     return arg_data
 
 
-def add_entity_type_parser(parser, entity_type: dict) -> None:
-    """Simplified interface to add entity type parsers to argparser"""
-    entity_parser = parser.add_parser(entity_type['name'], help=entity_type['help'])
-    endpoints = entity_type['endpoints']
-    subparser = entity_parser.add_subparsers(
-        description="Declare which endpoints to call",
-        required=True)
-
-    for endpoint in endpoints:
-        add_endpoint_parser(subparser, endpoint)
-
+def parse_arg_data(data_path: Path) -> list[dict]:
+    """Returns the (possibly cached) arg data for the arg data file"""
+    return argfiles.parse_arg_data(data_path, cache_path, prepare_arg_data)
 
-def add_endpoint_parser(parser, endpoint: dict) -> None:
-    """Simplified interface to add endpoint parsers to argparser"""
-    endpoint_parser = parser.add_parser(endpoint['name'], help=endpoint['help'])
-    endpoint_parser.set_defaults(path_handler=endpoint['path_handler'])
-    for arg in endpoint['args']:
-        endpoint_parser.add_argument(arg['name'], **arg.get('data', {}))
 
+def init_parsers(
+    parser: argparse.ArgumentParser,
+    arg_data: list[dict],
+    argv: Optional[list[str]] = None
+) -> None:
+    """Add an argument parser for each supported entity type
 
-def init_parsers(parser: argparse.ArgumentParser) -> None:
-    """Add an argument parser for each supported entity type"""
+    If the command line arguments are given, only the entity type they select
+    is built out in full. The other entity types just get placeholder parsers,
+    so they're still listed in usage messages.
+    """
     subparser = parser.add_subparsers(
         description="Declare which entity type to operate on",
         required=True)
 
-    for entity_type in parse_arg_data(arg_data_path):
-        add_entity_type_parser(subparser, entity_type)
+    for entity_type in arg_data:
+        argfiles.add_entity_type_parser(subparser, entity_type, argv)
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Create requests against the GA Management API")
+def parse_endpoint_args(argv: list[str], arg_data: list[dict]) -> Optional[argparse.Namespace]:
+    """Parse the command line directly against the selected endpoint
 
-    init_parsers(parser)
-    cmd_args = parser.parse_args()
-    path_handler = cmd_args.path_handler
+    The first two tokens name the entity type and endpoint.
+    """
+    endpoints = {
+        (entity["name"], endpoint["name"]): endpoint
+        for entity in arg_data
+        for endpoint in entity["endpoints"]
+    }
+    return argfiles.parse_endpoint_args(argv, endpoints, 2)
+
+
+def get_cli_opts(argv: list[str]) -> argparse.Namespace:
+    arg_data = parse_arg_data(arg_data_path)
+    cmd_args = parse_endpoint_args(argv, arg_data)
+    if cmd_args is None:
+        parser = argparse.ArgumentParser(
+            description="Create requests against the GA Management API")
+        init_parsers(parser, arg_data, argv)
+        cmd_args = parser.parse_args(argv)
+    return cmd_args
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Make the request described by the command line arguments"""
+    cmd_args = get_cli_opts(sys.argv[1:] if argv is None else argv)
+    # Only import the client libraries & authenticate once the command line
+    # is known to be valid
+    from google_auth import Services, send_request
+    service = Services.from_auth_context("GoogleAds").tagmanager_service
+    path_handler = ApiPath(*cmd_args.path_spec)
+    path_handler.create_library_function(service)
     path_handler.parse_path_args(cmd_args)
     path_handler.do_special_arg_handling(cmd_args)
-    delattr(cmd_args, 'path_handler')
+    del vars(cmd_args)['path_spec']
 
-    if hasattr(cmd_args, 'body'):
-        cmd_args.body = json.load(cmd_args.body)
+    if vars(cmd_args).pop('has_body'):
+        cmd_args.body = json_io.load(cmd_args.body)
     request = path_handler.library_function(**vars(cmd_args))
     response = send_request(request)
 
-    # The client library sometimes returns a bytes object instead of a
-    # dictionary, so coerce it into a dict if needed
-    if hasattr(response, "decode"):
-        response = json.loads(response)
-    json.dump(response, sys.stdout)
-    print()
+    # The client library sometimes returns the raw response body instead of a
+    # dictionary. It's already JSON, so pass it through rather than parsing it
+    # only to serialize it straight back out. Empty bodies (e.g. from deletes)
+    # are written as an empty JSON object, as ga-management.py does
+    if isinstance(response, (bytes, bytearray)):
+        sys.stdout.buffer.write(response or b"{}")
+        sys.stdout.buffer.write(b"\n")
+    else:
+        json_io.write_line(response, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
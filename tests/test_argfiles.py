@@ -0,0 +1,85 @@
+import pickle
+import tempfile
+from pathlib import Path
+from unittest import TestCase, main
+
+import argfiles
+import json_io
+
+
+ARG_DATA = [
+    {
+        "name": "tags",
+        "help": "Tags",
+        "endpoints": [
+            {
+                "name": "get",
+                "help": "Get a tag",
+                "args": [
+                    {"name": "--tagId", "data": {"type": "string"}},
+                    {"name": "--limit", "data": {"type": "integer"}},
+                    {"name": "body", "data": {"type": "FILE"}},
+                ],
+            }
+        ],
+    }
+]
+
+
+def prepare(arg_data: list[dict]) -> list[dict]:
+    for entity in arg_data:
+        for endpoint in entity["endpoints"]:
+            endpoint["defaults"] = {"endpoint": (entity["name"], endpoint["name"])}
+            argfiles.prepare_args(endpoint)
+    return arg_data
+
+
+class TestParseArgData(TestCase):
+    def setUp(self) -> None:
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.data_path = Path(root.name) / "args.json"
+        self.data_path.write_bytes(json_io.dumps(ARG_DATA))
+        self.cache_path = Path(root.name) / "cache" / "args.pkl"
+        argfiles.load_arg_data.cache_clear()
+        self.addCleanup(argfiles.load_arg_data.cache_clear)
+
+    def parse(self) -> list[dict]:
+        argfiles.load_arg_data.cache_clear()
+        return argfiles.parse_arg_data(self.data_path, self.cache_path, prepare)
+
+    def testPreparesAndCachesArgData(self) -> None:
+        arg_data = self.parse()
+        args = arg_data[0]["endpoints"][0]["args"]
+        self.assertIs(int, args[1]["data"]["type"])
+        self.assertEqual("?", args[2]["data"]["nargs"])
+        _, cached = pickle.loads(self.cache_path.read_bytes())
+        self.assertEqual(arg_data[0]["endpoints"][0]["defaults"],
+                         cached[0]["endpoints"][0]["defaults"])
+
+    def testRebuildsUnreadableCaches(self) -> None:
+        stale_caches = [
+            b"",  # truncated mid-write
+            b"not a pickle",
+            pickle.dumps(("digest",)),  # an older cache layout
+            pickle.dumps(None),
+            b"cno_such_module\nname\n.",  # refers to a module that's gone
+        ]
+        self.cache_path.parent.mkdir(parents=True)
+        for stale in stale_caches:
+            with self.subTest(stale=stale):
+                self.cache_path.write_bytes(stale)
+                arg_data = self.parse()
+                defaults = arg_data[0]["endpoints"][0]["defaults"]
+                self.assertEqual(("tags", "get"), defaults["endpoint"])
+
+    def testRebuildsWhenArgFileChanges(self) -> None:
+        self.parse()
+        changed = json_io.loads(json_io.dumps(ARG_DATA))
+        changed[0]["name"] = "triggers"
+        self.data_path.write_bytes(json_io.dumps(changed))
+        self.assertEqual("triggers", self.parse()[0]["name"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import sys
+from importlib.util import module_from_spec, spec_from_file_location
+from pathlib import Path
+from typing import Optional
+from unittest import TestCase, main
+from unittest.mock import patch
+
+import google_auth
+import json_io
+from google_auth import RequestLimiter
+from tests.test_google_auth import HttpError, errors_module
+
+# The script's file name isn't a valid module name, so it's loaded by path
+spec = spec_from_file_location(
+    "ga_management", Path(__file__).parent.parent / "ga-management.py")
+ga_management = module_from_spec(spec)
+spec.loader.exec_module(ga_management)
+
+
+def string_arg(name: str) -> dict:
+    return {"name": name, "data": {"help": name, "type": "string"}}
+
+
+ARG_DATA = [
+    {
+        "name": "management",
+        "help": None,
+        "entities": [
+            {
+                "name": "goals",
+                "help": "Goals",
+                "endpoints": [
+                    {
+                        "name": "get",
+                        "help": "Get a goal",
+                        "args": [string_arg("accountId"), string_arg("goalId")],
+                    },
+                    {
+                        "name": "update",
+                        "help": "Update a goal",
+                        "args": [
+                            string_arg("accountId"),
+                            string_arg("goalId"),
+                            {"name": "body", "data": {"help": "body", "type": "FILE"}},
+                            string_arg("--fields"),
+                        ],
+                    },
+                ],
+            }
+        ],
+    }
+]
+
+
+def prepared_arg_data() -> list[dict]:
+    return ga_management.prepare_arg_data(json_io.loads(json_io.dumps(ARG_DATA)))
+
+
+class FakeRequest:
+    def __init__(self, response: dict) -> None:
+        self.response = response
+        self.attempts = 0
+
+    def execute(self) -> dict:
+        self.attempts += 1
+        return self.response
+
+
+class FakeBatch:
+    """Batch request that fails the requests given, and runs the others"""
+
+    def __init__(self, callback, failures: dict) -> None:
+        self.callback = callback
+        self.failures = failures
+        self.requests: list[tuple[str, FakeRequest]] = []
+
+    def add(self, request: FakeRequest, request_id: str) -> None:
+        self.requests.append((request_id, request))
+
+    def execute(self) -> None:
+        for request_id, request in self.requests:
+            error = self.failures.pop(id(request), None)
+            if error is None:
+                self.callback(request_id, request.execute(), None)
+            else:
+                self.callback(request_id, None, error)
+
+
+class FakeService:
+    def __init__(self, failures: Optional[dict] = None) -> None:
+        self.failures = failures or {}
+        self.batches: list[FakeBatch] = []
+
+    def new_batch_http_request(self, callback) -> FakeBatch:
+        self.batches.append(FakeBatch(callback, self.failures))
+        return self.batches[-1]
+
+
+class StartIndexResource:
+    """List resource paged by start index, as most of the v3 API is"""
+
+    def __init__(self, total: int, page_size: int) -> None:
+        self.items = list(range(total))
+        self.page_size = page_size
+        self.calls: list[dict] = []
+
+    def list(self, accountId: str, start_index: int = 1) -> FakeRequest:
+        self.calls.append({"accountId": accountId, "start_index": start_index})
+        page = {
+            "items": self.items[start_index - 1:start_index - 1 + self.page_size],
+            "startIndex": start_index,
+            "itemsPerPage": self.page_size,
+        }
+        if start_index - 1 + self.page_size < len(self.items):
+            page["nextLink"] = "next"
+        return FakeRequest(page)
+
+
+class PageTokenResource:
+    """List resource paged by page token, with the client library's list_next"""
+
+    def list(self) -> FakeRequest:
+        return FakeRequest({"items": [0, 1], "nextPageToken": "2"})
+
+    def list_next(self, request: FakeRequest, page: dict):
+        if "nextPageToken" not in page:
+            return None
+        return FakeRequest({"items": [2]})
+
+
+class ClientTestCase(TestCase):
+    """Sends requests through send_request without any real client library"""
+
+    def setUp(self) -> None:
+        patches = [
+            patch.dict(sys.modules, {"googleapiclient.errors": errors_module}),
+            patch.object(google_auth, "_limiter", RequestLimiter()),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestPaginate(ClientTestCase):
+    def testFollowsStartIndexPages(self) -> None:
+        resource = StartIndexResource(total=5, page_size=2)
+        params = {"accountId": "1"}
+        pages = list(ga_management.paginate(
+            resource.list, resource.list(**params), params))
+        self.assertEqual([[0, 1], [2, 3], [4]], [page["items"] for page in pages])
+        self.assertEqual([1, 3, 5], [call["start_index"] for call in resource.calls])
+        self.assertTrue(all(call["accountId"] == "1" for call in resource.calls))
+
+    def testSinglePage(self) -> None:
+        resource = StartIndexResource(total=2, page_size=5)
+        pages = list(ga_management.paginate(
+            resource.list, resource.list("1"), {"accountId": "1"}))
+        self.assertEqual([[0, 1]], [page["items"] for page in pages])
+
+    def testFollowsPageTokens(self) -> None:
+        resource = PageTokenResource()
+        pages = list(ga_management.paginate(resource.list, resource.list(), {}))
+        self.assertEqual([[0, 1], [2]], [page["items"] for page in pages])
+
+
+class TestSendBatched(ClientTestCase):
+    def testSingleRequestIsSentDirectly(self) -> None:
+        service = FakeService()
+        request = FakeRequest({"id": 0})
+        self.assertEqual([{"id": 0}], list(ga_management.send_batched(service, [request])))
+        self.assertEqual([], service.batches)
+
+    def testBatchesKeepSubmissionOrder(self) -> None:
+        service = FakeService()
+        requests = [FakeRequest({"id": n}) for n in range(12)]
+        responses = list(ga_management.send_batched(service, requests))
+        self.assertEqual([{"id": n} for n in range(12)], responses)
+        self.assertEqual(
+            [ga_management.BATCH_SIZE, 2],
+            [len(batch.requests) for batch in service.batches])
+
+    def testRetryableFailuresAreResentAlone(self) -> None:
+        requests = [FakeRequest({"id": n}) for n in range(3)]
+        service = FakeService({id(requests[1]): HttpError(503)})
+        responses = list(ga_management.send_batched(service, requests))
+        self.assertEqual([{"id": n} for n in range(3)], responses)
+        self.assertEqual([1, 1, 1], [request.attempts for request in requests])
+        self.assertEqual(1, len(service.batches))
+
+    def testOtherFailuresAreRaised(self) -> None:
+        requests = [FakeRequest({"id": n}) for n in range(3)]
+        service = FakeService({id(requests[1]): HttpError(404)})
+        responses = ga_management.send_batched(service, requests)
+        self.assertEqual({"id": 0}, next(responses))
+        with self.assertRaises(HttpError):
+            next(responses)
+
+
+class TestParseEndpointArgs(TestCase):
+    def setUp(self) -> None:
+        self.arg_data = prepared_arg_data()
+
+    def testParsesSelectedEndpointDirectly(self) -> None:
+        argv = ["management", "goals", "get", "12", "34"]
+        cmd_args = ga_management.parse_endpoint_args(argv, self.arg_data)
+        self.assertEqual(
+            {"accountId": "12", "goalId": "34", "lib_path": ("management", "goals", "get")},
+            vars(cmd_args))
+
+    def testBodyReplacesRedundantEntityId(self) -> None:
+        argv = ["management", "goals", "update", "12", "--fields", "id"]
+        cmd_args = ga_management.parse_endpoint_args(argv, self.arg_data)
+        self.assertEqual("12", cmd_args.accountId)
+        self.assertEqual("id", cmd_args.fields)
+        self.assertIs(sys.stdin, cmd_args.body)
+        self.assertNotIn("goalId", vars(cmd_args))
+
+    def testFallsBackForCommandGroupsAndUnknownEndpoints(self) -> None:
+        for argv in (
+            ["management", "goals"],
+            ["management", "--help"],
+            ["management", "goals", "delete", "12"],
+            ["management", "goals", "-h"],
+        ):
+            with self.subTest(argv=argv):
+                self.assertIsNone(ga_management.parse_endpoint_args(argv, self.arg_data))
+
+    def testFullParserIsOnlyBuiltForFallbacks(self) -> None:
+        patcher = patch.object(ga_management, "parse_arg_data", return_value=self.arg_data)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with patch.object(ga_management, "init_parsers") as init_parsers:
+            cmd_args = ga_management.get_cli_opts(["management", "goals", "get", "12", "34"])
+        init_parsers.assert_not_called()
+        self.assertEqual(("management", "goals", "get"), cmd_args.lib_path)
+
+        # the full parser reports unknown endpoints
+        with self.assertRaises(SystemExit), patch("sys.stderr"):
+            ga_management.get_cli_opts(["management", "goals", "delete"])
+
+
+if __name__ == "__main__":
+    main()
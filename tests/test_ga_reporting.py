@@ -0,0 +1,151 @@
+import io
+import sys
+import tempfile
+from datetime import date, timedelta
+from importlib.util import module_from_spec, spec_from_file_location
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import TestCase, main
+from unittest.mock import patch
+
+import google_auth
+import json_io
+from google_auth import RequestLimiter
+from tests.test_google_auth import errors_module
+
+# The script's file name isn't a valid module name, so it's loaded by path
+spec = spec_from_file_location(
+    "ga_reporting", Path(__file__).parent.parent / "ga-reporting.py")
+ga_reporting = module_from_spec(spec)
+spec.loader.exec_module(ga_reporting)
+
+
+def request_body(view_id: str = "1", metric: str = "ga:sessions", end: str = "2020-01-31") -> dict:
+    return {
+        "reportRequests": [
+            {
+                "viewId": view_id,
+                "dateRanges": [{"startDate": "2020-01-01", "endDate": end}],
+                "metrics": [{"expression": metric}],
+            }
+        ]
+    }
+
+
+def text_input(data: bytes) -> io.TextIOWrapper:
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8")
+
+
+class FakeRequest:
+    def __init__(self, response: dict) -> None:
+        self.response = response
+        self.http = None
+
+    def execute(self) -> dict:
+        return self.response
+
+
+class FakeReports:
+    """Reports resource whose batchGet echoes each report request back"""
+
+    def __init__(self) -> None:
+        self.bodies: list[dict] = []
+
+    def batchGet(self, body: dict) -> FakeRequest:
+        self.bodies.append(body)
+        reports = [{"request": request} for request in body["reportRequests"]]
+        return FakeRequest({"reports": reports, "queryCost": 1})
+
+
+class TestReadJsonInput(TestCase):
+    def testReadsJsonLines(self) -> None:
+        bodies = [request_body(metric=f"ga:metric{n}") for n in range(3)]
+        data = b"\n".join(json_io.dumps(body) for body in bodies) + b"\n\n"
+        self.assertEqual(bodies, list(ga_reporting.read_json_input(text_input(data))))
+
+    def testReadsPrettyPrintedDocument(self) -> None:
+        body = request_body()
+        data = b'{\n  "reportRequests":\n' + json_io.dumps(body["reportRequests"]) + b"\n}\n"
+        self.assertEqual([body], list(ga_reporting.read_json_input(text_input(data))))
+
+    def testEmptyInputYieldsNothing(self) -> None:
+        for data in (b"", b"\n\n"):
+            self.assertEqual([], list(ga_reporting.read_json_input(text_input(data))))
+
+    def testSkipsBlankLines(self) -> None:
+        body = request_body()
+        data = b"\n" + json_io.dumps(body) + b"\n\n" + json_io.dumps(body) + b"\n  \n"
+        self.assertEqual(
+            [body, body], list(ga_reporting.read_json_input(text_input(data))))
+
+
+class TestPackRequests(TestCase):
+    def testPacksAtMostFiveReportRequests(self) -> None:
+        bodies = [request_body(metric=f"ga:metric{n}") for n in range(7)]
+        groups = list(ga_reporting.pack_requests(bodies))
+        self.assertEqual([5, 2], [len(group) for group in groups])
+        self.assertEqual(bodies, [body for group in groups for body in group])
+
+    def testDifferentViewsAreNotPacked(self) -> None:
+        bodies = [request_body("1"), request_body("2"), request_body("1")]
+        groups = list(ga_reporting.pack_requests(bodies))
+        self.assertEqual([[bodies[0], bodies[2]], [bodies[1]]], groups)
+
+
+class TestExecuteRequest(TestCase):
+    def setUp(self) -> None:
+        patches = [
+            patch.dict(sys.modules, {"googleapiclient.errors": errors_module}),
+            patch.object(google_auth, "_limiter", RequestLimiter()),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.reports = FakeReports()
+        self.services = SimpleNamespace(
+            analytics_service=SimpleNamespace(reports=lambda: self.reports),
+            thread_http=object(),
+        )
+
+    def testSplitsPackedResponse(self) -> None:
+        bodies = [request_body(metric=f"ga:metric{n}") for n in range(7)]
+        for group in ga_reporting.pack_requests(bodies):
+            responses = ga_reporting.execute_request(self.services, group)
+            self.assertEqual(len(group), len(responses))
+            for body, response in zip(group, responses):
+                self.assertEqual(
+                    body["reportRequests"],
+                    [report["request"] for report in response["reports"]])
+                self.assertEqual(1, response["queryCost"])
+        self.assertEqual(
+            [5, 2], [len(body["reportRequests"]) for body in self.reports.bodies])
+
+
+class TestResponseCache(TestCase):
+    def setUp(self) -> None:
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.cache = ga_reporting.ResponseCache(root.name)
+
+    def testMissThenHit(self) -> None:
+        body = request_body()
+        self.assertIsNone(self.cache.get(body))
+        self.cache.set(body, {"reports": []})
+        self.assertEqual({"reports": []}, self.cache.get(body))
+        self.assertIsNone(self.cache.get(request_body(view_id="2")))
+
+    def testRelativeDatesAreNeverCached(self) -> None:
+        body = request_body(end="yesterday")
+        self.cache.set(body, {"reports": []})
+        self.assertIsNone(self.cache.get(body))
+
+    def testRangesEndingTodayAreNeverCached(self) -> None:
+        for end in (date.today(), date.today() + timedelta(days=1)):
+            body = request_body(end=end.isoformat())
+            self.cache.set(body, {"reports": []})
+            self.assertIsNone(self.cache.get(body))
+        self.assertEqual([], list(Path(self.cache.root).iterdir()))
+
+
+if __name__ == "__main__":
+    main()
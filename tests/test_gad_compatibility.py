@@ -0,0 +1,50 @@
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import TestCase, main
+from unittest.mock import patch
+
+import gad_compatibility
+from gad_compatibility import fetch_fields, read_cached_field
+
+
+FIELD = {"selectable_with": ["segments.date"], "segments": [], "metrics": []}
+
+
+class FakeFieldService:
+    def __init__(self) -> None:
+        self.queries: list[str] = []
+
+    def search_google_ads_fields(self, request: dict) -> list:
+        self.queries.append(request["query"])
+        return [SimpleNamespace(name="campaign.id", **FIELD)]
+
+
+class TestFieldCache(TestCase):
+    def setUp(self) -> None:
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.cache_dir = Path(root.name)
+        patcher = patch.object(gad_compatibility, "CACHE_DIR", self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testCachesFetchedFields(self) -> None:
+        service = FakeFieldService()
+        self.assertEqual({"campaign.id": FIELD}, fetch_fields(["campaign.id"], service))
+        self.assertEqual({"campaign.id": FIELD}, fetch_fields(["campaign.id"], service))
+        self.assertEqual(1, len(service.queries))
+        self.assertEqual(["campaign.id.json"], [p.name for p in self.cache_dir.iterdir()])
+
+    def testCorruptCacheFileIsAMiss(self) -> None:
+        (self.cache_dir / "campaign.id.json").write_bytes(b'{"selectable_with": [')
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(read_cached_field("campaign.id"))
+        service = FakeFieldService()
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual({"campaign.id": FIELD}, fetch_fields(["campaign.id"], service))
+        self.assertEqual(FIELD, read_cached_field("campaign.id"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import gc
+import os
+import pickle
+import sys
+import tempfile
+import time
+import weakref
+from pathlib import PosixPath
+from types import ModuleType, SimpleNamespace
+from unittest import TestCase, main
+from unittest.mock import patch
+
+import yaml
+
+import google_auth
+import json_io
+from google_auth import (
+    BACKOFF_CAP,
+    DiscoveryFileCache,
+    DiscoveryServices,
+    GoogleAdsToken,
+    RequestLimiter,
+    Services,
+    read_token_info,
+    retry_after,
+    send_request,
+)
+
+
+class HttpError(Exception):
+    """Stand-in for googleapiclient's HttpError, carrying the same fields"""
+
+    def __init__(self, status: int, content: bytes = b"", **headers: str) -> None:
+        super().__init__(status)
+        self.resp = Response(status, headers)
+        self.content = content
+
+
+class Response(dict):
+    def __init__(self, status: int, headers: dict[str, str]) -> None:
+        super().__init__(headers)
+        self.status = status
+
+
+class FakeRequest:
+    """Request whose execute() raises or returns each given outcome in turn"""
+
+    def __init__(self, *outcomes) -> None:
+        self.outcomes = list(outcomes)
+        self.attempts = 0
+
+    def execute(self):
+        self.attempts += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+errors_module = ModuleType("googleapiclient.errors")
+errors_module.HttpError = HttpError  # type: ignore[attr-defined]
+
+
+class TestSendRequest(TestCase):
+    def setUp(self) -> None:
+        # a fresh limiter, so no limiter state is read from or saved to disk.
+        # It's fast enough that its own waits never hold up the tests
+        self.limiter = RequestLimiter(rate=1e6, max_rate=1e6, trip_threshold=10)
+        patches = [
+            patch.dict(sys.modules, {"googleapiclient.errors": errors_module}),
+            patch.object(google_auth, "_limiter", self.limiter),
+            patch.object(google_auth.time, "sleep"),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sleep = google_auth.time.sleep
+
+    def testReturnsResponseWithoutRetrying(self) -> None:
+        request = FakeRequest({"ok": True})
+        self.assertEqual({"ok": True}, send_request(request))
+        self.assertEqual(1, request.attempts)
+        self.sleep.assert_not_called()
+
+    def testRetriesRateLimitedRequestAfterRequestedWait(self) -> None:
+        request = FakeRequest(HttpError(429, **{"retry-after": "3"}), {"ok": True})
+        self.assertEqual({"ok": True}, send_request(request))
+        self.assertEqual(2, request.attempts)
+        self.sleep.assert_called_once_with(3.0)
+
+    def testRetriesServerErrorsWithCappedBackoff(self) -> None:
+        request = FakeRequest(HttpError(503), HttpError(502), {"ok": True})
+        self.assertEqual({"ok": True}, send_request(request))
+        self.assertEqual(3, request.attempts)
+        self.assertEqual(2, self.sleep.call_count)
+        for call in self.sleep.call_args_list:
+            self.assertLessEqual(call.args[0], BACKOFF_CAP)
+
+    def testRetriesRetryableErrorReasons(self) -> None:
+        content = b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'
+        request = FakeRequest(HttpError(403, content), {"ok": True})
+        self.assertEqual({"ok": True}, send_request(request))
+        self.assertEqual(2, request.attempts)
+
+    def testRaisesNonRetryableErrorImmediately(self) -> None:
+        request = FakeRequest(HttpError(404, b'{"error": {"code": 404}}'))
+        with self.assertLogs(level="ERROR"), self.assertRaises(HttpError):
+            send_request(request)
+        self.assertEqual(1, request.attempts)
+        self.sleep.assert_not_called()
+
+    def testGivesUpAfterMaxRetries(self) -> None:
+        request = FakeRequest(*(HttpError(503) for _ in range(6)))
+        with self.assertLogs(level="ERROR"), self.assertRaises(HttpError):
+            send_request(request)
+        self.assertEqual(6, request.attempts)
+
+    def testOnlyRateLimitingShrinksSavedQuota(self) -> None:
+        send_request(FakeRequest(HttpError(503), {"ok": True}))
+        self.assertLess(self.limiter.window, self.limiter.quota_window)
+        quota_window = self.limiter.quota_window
+        send_request(FakeRequest(HttpError(429), {"ok": True}))
+        self.assertLess(self.limiter.quota_window, quota_window)
+
+
+class TestRetryAfter(TestCase):
+    def testRetryAfterSeconds(self) -> None:
+        self.assertEqual(3.0, retry_after(HttpError(429, **{"retry-after": "3"})))
+
+    def testEpochResetIsWaitedUntil(self) -> None:
+        reset = str(int(time.time()) + 5)
+        wait = retry_after(HttpError(429, **{"x-ratelimit-reset": reset}))
+        self.assertIsNotNone(wait)
+        self.assertLessEqual(wait, 5.0)
+        self.assertGreater(wait, 3.0)
+
+    def testWaitsAreCapped(self) -> None:
+        far_future = str(int(time.time()) + 10**9)
+        error = HttpError(429, **{"x-ratelimit-reset": far_future})
+        self.assertEqual(BACKOFF_CAP, retry_after(error))
+        error = HttpError(429, **{"retry-after": "Wed, 21 Oct 2099 07:28:00 GMT"})
+        self.assertEqual(BACKOFF_CAP, retry_after(error))
+
+    def testNoWaitRequested(self) -> None:
+        self.assertIsNone(retry_after(HttpError(503)))
+        self.assertIsNone(retry_after(HttpError(429, **{"retry-after": "soon"})))
+
+
+def fake_services(refresh_token: str) -> Services:
+    """Returns a session whose credentials & transport need no auth files"""
+    creds = SimpleNamespace(
+        client_id="client", refresh_token=refresh_token, scopes=["analytics"])
+    auth_root = SimpleNamespace(
+        wd_acct_name=refresh_token,
+        scopes=frozenset({refresh_token}),
+        context=SimpleNamespace(ads_auth_path=None),
+        credentials=lambda force_refresh: creds,
+    )
+    services = Services(auth_root)  # type: ignore[arg-type]
+    services.http = object()
+    return services
+
+
+class TestDiscoveryCache(TestCase):
+    def setUp(self) -> None:
+        self.builds: list[tuple] = []
+        discovery_module = ModuleType("googleapiclient.discovery")
+        discovery_module.build = (  # type: ignore[attr-defined]
+            lambda *args, **kwargs: self.builds.append(args) or object())
+        errors = ModuleType("googleapiclient.errors")
+        errors.UnknownApiNameOrVersion = LookupError  # type: ignore[attr-defined]
+        patches = [
+            patch.dict(sys.modules, {
+                "googleapiclient.discovery": discovery_module,
+                "googleapiclient.errors": errors,
+            }),
+            patch.object(Services, "_discovery_cache", {}),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def testSessionsWithSameCredentialsShareServices(self) -> None:
+        first, second = fake_services("1//token"), fake_services("1//token")
+        self.assertIsNot(first, second)
+        self.assertIs(first.sheets_service, second.sheets_service)
+        self.assertEqual([("sheets", "v4")], self.builds)
+
+    def testSessionsWithOtherCredentialsBuildTheirOwn(self) -> None:
+        first, second = fake_services("1//token"), fake_services("1//other")
+        self.assertIsNot(first.sheets_service, second.sheets_service)
+        self.assertEqual(2, len(self.builds))
+
+    def testCachedServicesDontKeepSessionsAlive(self) -> None:
+        services = fake_services("1//token")
+        services.discovery_service(DiscoveryServices.Sheets)
+        session = weakref.ref(services)
+        del services
+        gc.collect()
+        self.assertIsNone(session())
+
+
+class TestDiscoveryFileCache(TestCase):
+    def setUp(self) -> None:
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.cache = DiscoveryFileCache(root.name, max_age=60)
+        self.url = "https://www.googleapis.com/discovery/v1/apis/content/v2.1/rest"
+
+    def testMissThenHit(self) -> None:
+        self.assertIsNone(self.cache.get(self.url))
+        self.cache.set(self.url, '{"name": "content"}')
+        self.assertEqual('{"name": "content"}', self.cache.get(self.url))
+        self.assertIsNone(self.cache.get(self.url + "?fields=name"))
+
+    def testExpiredDocumentsAreMisses(self) -> None:
+        self.cache.set(self.url, '{"name": "content"}')
+        an_hour_ago = time.time() - 60 * 60
+        os.utime(self.cache.path(self.url), (an_hour_ago, an_hour_ago))
+        self.assertIsNone(self.cache.get(self.url))
+
+
+TOKEN_INFO = {"token": "access", "refresh_token": "1//refresh", "scopes": ["a", "b"]}
+
+
+class PickledCredentials:
+    """Stand-in for the Credentials objects that token files used to pickle"""
+
+    def to_json(self) -> str:
+        return json_io.dumps(TOKEN_INFO).decode()
+
+
+class TestReadTokenInfo(TestCase):
+    def setUp(self) -> None:
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.token_path = PosixPath(root.name) / "token.json"
+        read_token_info.cache_clear()
+        self.addCleanup(read_token_info.cache_clear)
+
+    def read(self):
+        return read_token_info(self.token_path, self.token_path.stat().st_mtime_ns)
+
+    def testReadsJsonTokenFile(self) -> None:
+        self.token_path.write_bytes(json_io.dumps(TOKEN_INFO))
+        info = self.read()
+        self.assertEqual(TOKEN_INFO, dict(info))
+        with self.assertRaises(TypeError):
+            info["token"] = "changed"  # type: ignore[index]
+
+    def testMigratesPickledTokenFileToJson(self) -> None:
+        self.token_path.write_bytes(pickle.dumps(PickledCredentials()))
+        self.assertEqual(TOKEN_INFO, dict(self.read()))
+        self.assertEqual(TOKEN_INFO, json_io.loads(self.token_path.read_bytes()))
+
+    def testUnreadableTokenFileRaisesValueError(self) -> None:
+        self.token_path.write_bytes(b"neither JSON nor a pickle")
+        with self.assertRaises(ValueError):
+            self.read()
+
+
+ADS_YAML = """\
+# Google Ads API credentials
+developer_token: abc-123
+client_id: 1234.apps.googleusercontent.com
+refresh_token: 1//old-token
+use_proto_plus: True
+"""
+
+
+class TestGoogleAdsTokenWriteRefresh(TestCase):
+    def setUp(self) -> None:
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.token = GoogleAdsToken(root.name, "google-ads.yaml")
+
+    def testPatchesRefreshTokenLineInPlace(self) -> None:
+        self.token.write_text(ADS_YAML)
+        self.token.write_refresh("1//new-token")
+        self.assertEqual(
+            ADS_YAML.replace("1//old-token", "1//new-token"), self.token.read_text())
+
+    def testAddsMissingRefreshToken(self) -> None:
+        self.token.write_text(ADS_YAML.replace("refresh_token: 1//old-token\n", ""))
+        self.token.write_refresh("1//new-token")
+        data = yaml.safe_load(self.token.read_text())
+        self.assertEqual("1//new-token", data["refresh_token"])
+        self.assertEqual("abc-123", data["developer_token"])
+
+    def testQuotesTokensYamlWouldMisread(self) -> None:
+        for refresh_token in ("12345", "true", "1//a: b", "null"):
+            with self.subTest(refresh_token=refresh_token):
+                self.token.write_text(ADS_YAML)
+                self.token.write_refresh(refresh_token)
+                data = yaml.safe_load(self.token.read_text())
+                self.assertEqual(refresh_token, data["refresh_token"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import io
+import tempfile
+from pathlib import Path
+from unittest import TestCase, main
+
+import json_io
+
+
+DOCUMENT = {"viewId": "123", "metrics": [{"expression": "ga:sessions"}], "é": None}
+
+
+class TestJsonIO(TestCase):
+    def testDumpsRoundTrips(self) -> None:
+        data = json_io.dumps(DOCUMENT)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(DOCUMENT, json_io.loads(data))
+        self.assertEqual(DOCUMENT, json_io.loads(data.decode("utf-8")))
+
+    def testWriteLineToBinaryFile(self) -> None:
+        file = io.BytesIO()
+        json_io.write_line(DOCUMENT, file)
+        json_io.write_line([1, 2], file)
+        lines = file.getvalue().splitlines()
+        self.assertEqual([DOCUMENT, [1, 2]], [json_io.loads(line) for line in lines])
+
+    def testWriteLineToTextFileGoesThroughBuffer(self) -> None:
+        buffer = io.BytesIO()
+        file = io.TextIOWrapper(buffer, encoding="utf-8")
+        json_io.write_line(DOCUMENT, file)
+        file.flush()
+        self.assertTrue(buffer.getvalue().endswith(b"\n"))
+        self.assertEqual(DOCUMENT, json_io.loads(buffer.getvalue()))
+
+    def testLoadFromTextFile(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            path = Path(root) / "doc.json"
+            path.write_bytes(json_io.dumps(DOCUMENT))
+            with path.open(encoding="utf-8") as file:
+                self.assertEqual(DOCUMENT, json_io.load(file))
+
+
+if __name__ == "__main__":
+    main()
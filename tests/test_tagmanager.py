@@ -0,0 +1,40 @@
+from argparse import Namespace
+from unittest import TestCase, main
+
+from tagmanager import ApiPath
+
+
+LIB_PATH = ("accounts", "containers", "workspaces", "tags")
+
+
+class TestApiPath(TestCase):
+    def testCompilesPathFromIdArgs(self) -> None:
+        cmd_args = Namespace(
+            accountId="1", containerId="2", workspaceId="3", tagId="4", fields=None)
+        ApiPath(LIB_PATH, "get", "path").parse_path_args(cmd_args)
+        self.assertEqual(
+            {"path": "accounts/1/containers/2/workspaces/3/tags/4", "fields": None},
+            vars(cmd_args))
+
+    def testParentPathLeavesOutTheEntity(self) -> None:
+        cmd_args = Namespace(accountId="1", containerId="2", workspaceId="3")
+        ApiPath(LIB_PATH, "create", "parent").parse_path_args(cmd_args)
+        self.assertEqual(
+            {"parent": "accounts/1/containers/2/workspaces/3"}, vars(cmd_args))
+
+    def testNoPathVariable(self) -> None:
+        cmd_args = Namespace(pageToken="next")
+        ApiPath(("accounts",), "list", None).parse_path_args(cmd_args)
+        self.assertEqual({"pageToken": "next"}, vars(cmd_args))
+
+    def testSplitsMovedEntityIds(self) -> None:
+        cmd_args = Namespace(tagId="1,2", triggerId=None, variableId="3")
+        path = ApiPath(LIB_PATH[:3] + ("folders",), "move_entities_to_folder", None)
+        path.do_special_arg_handling(cmd_args)
+        self.assertEqual(
+            {"tagId": ["1", "2"], "triggerId": None, "variableId": ["3"]},
+            vars(cmd_args))
+
+
+if __name__ == "__main__":
+    main()
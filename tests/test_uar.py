@@ -2,7 +2,8 @@ import yaml
 import json
 from unittest import TestCase, main
 from datetime import date
-from typing import Any, Sequence
+from types import MappingProxyType
+from typing import Any, AbstractSet, Mapping
 
 from uar_types import AliasedEnum, AliasedValue, UAFilterLiteral, KeyRequestPair
 from uar import (
@@ -22,10 +23,30 @@ from uar import (
     FilterType,
 )
 
+# Use the libyaml bindings where they're available
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-def get_fields(field_list: Sequence[str], obj: dict[str, Any]) -> dict[str, Any]:
-    _kl = filter(lambda field: field in obj, field_list)
-    return {key: obj[key] for key in _kl}
+
+# Expected date ranges & columns shared by the tests below
+FEB_2022 = DateRange(date(2022, 2, 1), date(2022, 2, 28))
+Q1_2022 = DateRange(date(2022, 1, 1), date(2022, 3, 31))
+
+DATE_DIMENSION = Column(ColumnType.DIMENSION, "date")
+MEDIUM_DIMENSION = Column(ColumnType.DIMENSION, "medium")
+SOURCE_DIMENSION = Column(ColumnType.DIMENSION, "source")
+SESSIONS_METRIC = Column(ColumnType.METRIC, "sessions")
+
+KEY_FIELDS = frozenset(
+    ["viewId", "dateRanges", "segments", "cohortGroup", "samplingLevel"]
+)
+OPTION_FIELDS = frozenset(
+    ["pageSize", "pageToken", "includeEmptyRows", "hideTotals", "hideValueRanges"]
+)
+COLUMN_FIELDS = frozenset(["dimensions", "metrics"])
+
+
+def get_fields(field_set: AbstractSet[str], obj: dict[str, Any]) -> dict[str, Any]:
+    return {key: obj[key] for key in obj.keys() & field_set}
 
 
 class TestUtilityFunctions(TestCase):
@@ -123,30 +144,32 @@ class TestBasicDocumentParse(TestCase):
             includeTotals: TRUE
             includeValueRanges: TRUE
         """,
-        Loader=yaml.SafeLoader,
+        Loader=YamlLoader,
     )
 
-    parsed_doc1: dict[str, Any] = {
-        "key": UARequestKey(
-            16619750,
-            (
-                DateRange(date(2022, 2, 1), date(2022, 2, 28)),
-                DateRange(date(2022, 1, 1), date(2022, 1, 31)),
+    parsed_doc1: Mapping[str, Any] = MappingProxyType(
+        {
+            "key": UARequestKey(
+                16619750,
+                (
+                    FEB_2022,
+                    DateRange(date(2022, 1, 1), date(2022, 1, 31)),
+                ),
+                SamplingLevel.DEFAULT,
             ),
-            SamplingLevel.DEFAULT,
-        ),
-        "columns": [
-            Column(ColumnType.DIMENSION, "medium"),
-            Column(ColumnType.DIMENSION, "source"),
-            Column(ColumnType.METRIC, "sessions"),
-        ],
-        "queryOptions": UAQueryOptions(
-            page_size=50,
-            include_totals=True,
-            include_empty_rows=False,
-            include_value_ranges=True,
-        ),
-    }
+            "columns": [
+                MEDIUM_DIMENSION,
+                SOURCE_DIMENSION,
+                SESSIONS_METRIC,
+            ],
+            "queryOptions": UAQueryOptions(
+                page_size=50,
+                include_totals=True,
+                include_empty_rows=False,
+                include_value_ranges=True,
+            ),
+        }
+    )
 
     parsed_1 = UARequest(
         parsed_doc1["key"],
@@ -154,41 +177,45 @@ class TestBasicDocumentParse(TestCase):
         query_options=parsed_doc1["queryOptions"],
     )
 
-    output = {
-        "viewId": "16619750",
-        "dateRanges": [
-            {"startDate": "2022-02-01", "endDate": "2022-02-28"},
-            {"startDate": "2022-01-01", "endDate": "2022-01-31"},
-        ],
-        "dimensions": [{"name": "ga:medium"}, {"name": "ga:source"}],
-        "metrics": [{"expression": "ga:sessions"}],
-        "samplingLevel": "DEFAULT",
-        "pageSize": 50,
-        "includeEmptyRows": False,
-        "hideTotals": False,
-        "hideValueRanges": False,
-    }
-
-    output_parts: dict[str, Any] = {
-        "key": {
+    output = MappingProxyType(
+        {
             "viewId": "16619750",
             "dateRanges": [
                 {"startDate": "2022-02-01", "endDate": "2022-02-28"},
                 {"startDate": "2022-01-01", "endDate": "2022-01-31"},
             ],
-            "samplingLevel": "DEFAULT",
-        },
-        "columns": {
             "dimensions": [{"name": "ga:medium"}, {"name": "ga:source"}],
             "metrics": [{"expression": "ga:sessions"}],
-        },
-        "queryOptions": {
+            "samplingLevel": "DEFAULT",
             "pageSize": 50,
             "includeEmptyRows": False,
             "hideTotals": False,
             "hideValueRanges": False,
-        },
-    }
+        }
+    )
+
+    output_parts: Mapping[str, Any] = MappingProxyType(
+        {
+            "key": {
+                "viewId": "16619750",
+                "dateRanges": [
+                    {"startDate": "2022-02-01", "endDate": "2022-02-28"},
+                    {"startDate": "2022-01-01", "endDate": "2022-01-31"},
+                ],
+                "samplingLevel": "DEFAULT",
+            },
+            "columns": {
+                "dimensions": [{"name": "ga:medium"}, {"name": "ga:source"}],
+                "metrics": [{"expression": "ga:sessions"}],
+            },
+            "queryOptions": {
+                "pageSize": 50,
+                "includeEmptyRows": False,
+                "hideTotals": False,
+                "hideValueRanges": False,
+            },
+        }
+    )
 
     def testParseDocKey(self) -> None:
         self.assertEqual(self.parsed_doc1["key"], UARequestKey.from_doc(self.doc_1))
@@ -197,11 +224,29 @@ class TestBasicDocumentParse(TestCase):
         self.assertEqual(
             self.parsed_1.dimensions,
             [
-                Column(ColumnType.DIMENSION, "medium"),
-                Column(ColumnType.DIMENSION, "source"),
+                MEDIUM_DIMENSION,
+                SOURCE_DIMENSION,
             ],
         )
-        self.assertEqual(self.parsed_1.metrics, [Column(ColumnType.METRIC, "sessions")])
+        self.assertEqual(self.parsed_1.metrics, [SESSIONS_METRIC])
+
+    def testParsedColumnsAndDateRangesAreShared(self) -> None:
+        self.assertIs(
+            UARequest.from_doc(self.doc_1).columns[0],
+            UARequest.from_doc(self.doc_1).columns[0],
+        )
+        self.assertIs(
+            UARequestKey.from_doc(self.doc_1).date_ranges[0],
+            UARequestKey.from_doc(self.doc_1).date_ranges[0],
+        )
+
+    def testParsedKeysAndQueryOptionsAreShared(self) -> None:
+        self.assertIs(
+            UARequestKey.from_doc(self.doc_1), UARequestKey.from_doc(self.doc_1)
+        )
+        self.assertIs(
+            UAQueryOptions.from_doc(self.doc_1), UAQueryOptions.from_doc(self.doc_1)
+        )
 
     def testParseDocQuery(self) -> None:
         self.assertEqual(
@@ -228,32 +273,14 @@ class TestBasicDocumentParse(TestCase):
         )
 
     def testOutputDocFull(self) -> None:
-        def get_key(request: dict[str, Any]) -> dict[str, Any]:
-            _kl = ["viewId", "dateRanges", "segments", "cohortGroup", "samplingLevel"]
-            return get_fields(_kl, request)
-
-        def get_opts(request: dict[str, Any]) -> dict[str, Any]:
-            _kl = [
-                "pageSize",
-                "pageToken",
-                "includeEmptyRows",
-                "hideTotals",
-                "hideValueRanges",
-            ]
-            return get_fields(_kl, request)
-
-        def get_columns(request: dict[str, Any]) -> dict[str, Any]:
-            _kl = ["dimensions", "metrics"]
-            return get_fields(_kl, request)
-
-        query = self.parsed_1
-        query_key = get_key(query.to_request)
-        query_opts = get_opts(query.to_request)
-        query_cols = get_columns(query.to_request)
+        request = self.parsed_1.to_request
+        query_key = get_fields(KEY_FIELDS, request)
+        query_opts = get_fields(OPTION_FIELDS, request)
+        query_cols = get_fields(COLUMN_FIELDS, request)
         self.assertEqual(query_key, self.output_parts["key"])
         self.assertEqual(query_opts, self.output_parts["queryOptions"])
         self.assertEqual(query_cols, self.output_parts["columns"])
-        self.assertEqual(query.to_request, self.output)
+        self.assertEqual(request, self.output)
 
 
 class TestDocumentWithNoQueryOptions(TestCase):
@@ -270,18 +297,18 @@ class TestDocumentWithNoQueryOptions(TestCase):
             metrics:
                 - 'sessions'
         """,
-        Loader=yaml.SafeLoader,
+        Loader=YamlLoader,
     )
 
     query = UARequest(
         key=UARequestKey(
             16619750,
-            (DateRange(date(2022, 2, 1), date(2022, 2, 28)),),
+            (FEB_2022,),
             SamplingLevel.LARGE,
         ),
         columns=[
-            Column(ColumnType.DIMENSION, "date"),
-            Column(ColumnType.METRIC, "sessions"),
+            DATE_DIMENSION,
+            SESSIONS_METRIC,
         ],
         query_options=UAQueryOptions(
             page_size=10000,
@@ -291,17 +318,19 @@ class TestDocumentWithNoQueryOptions(TestCase):
         ),
     )
 
-    request = {
-        "viewId": "16619750",
-        "dateRanges": [{"startDate": "2022-02-01", "endDate": "2022-02-28"}],
-        "dimensions": [{"name": "ga:date"}],
-        "metrics": [{"expression": "ga:sessions"}],
-        "samplingLevel": "LARGE",
-        "pageSize": 10000,
-        "includeEmptyRows": False,
-        "hideTotals": True,
-        "hideValueRanges": True,
-    }
+    request = MappingProxyType(
+        {
+            "viewId": "16619750",
+            "dateRanges": [{"startDate": "2022-02-01", "endDate": "2022-02-28"}],
+            "dimensions": [{"name": "ga:date"}],
+            "metrics": [{"expression": "ga:sessions"}],
+            "samplingLevel": "LARGE",
+            "pageSize": 10000,
+            "includeEmptyRows": False,
+            "hideTotals": True,
+            "hideValueRanges": True,
+        }
+    )
 
     def testDocParsesWithNoQueryOpts(self) -> None:
         self.assertEqual(self.query, UARequest.from_doc(self.doc))
@@ -330,7 +359,7 @@ class TestDocumentWithFiltersParse(TestCase):
             metrics:
                 - "sessions >= 100"
         """,
-        Loader=yaml.SafeLoader,
+        Loader=YamlLoader,
     )
 
     parsed_filters = [
@@ -362,26 +391,32 @@ class TestDocumentWithFiltersParse(TestCase):
         },
     ]
 
-    request = {
-        "viewId": "16619750",
-        "dateRanges": [{"startDate": "2022-02-01", "endDate": "2022-02-28"}],
-        "samplingLevel": "LARGE",
-        "dimensions": [{"name": "ga:date"}],
-        "metrics": [{"expression": "ga:sessions"}],
-        "dimensionFilterClauses": [{"operator": "AND", "filters": request_filters[:2]}],
-        "metricFilterClauses": [{"operator": "AND", "filters": request_filters[2:]}],
-        "samplingLevel": "LARGE",
-        "pageSize": 10000,
-        "includeEmptyRows": False,
-        "hideTotals": True,
-        "hideValueRanges": True,
-    }
+    request = MappingProxyType(
+        {
+            "viewId": "16619750",
+            "dateRanges": [{"startDate": "2022-02-01", "endDate": "2022-02-28"}],
+            "samplingLevel": "LARGE",
+            "dimensions": [{"name": "ga:date"}],
+            "metrics": [{"expression": "ga:sessions"}],
+            "dimensionFilterClauses": [
+                {"operator": "AND", "filters": request_filters[:2]}
+            ],
+            "metricFilterClauses": [
+                {"operator": "AND", "filters": request_filters[2:]}
+            ],
+            "samplingLevel": "LARGE",
+            "pageSize": 10000,
+            "includeEmptyRows": False,
+            "hideTotals": True,
+            "hideValueRanges": True,
+        }
+    )
 
     query = UARequest(
-        key=UARequestKey(16619750, (DateRange(date(2022, 2, 1), date(2022, 2, 28)),)),
+        key=UARequestKey(16619750, (FEB_2022,)),
         columns=[
-            Column(ColumnType.DIMENSION, "date"),
-            Column(ColumnType.METRIC, "sessions"),
+            DATE_DIMENSION,
+            SESSIONS_METRIC,
         ],
         filters=parsed_filters,
     )
@@ -398,6 +433,17 @@ class TestDocumentWithFiltersParse(TestCase):
             self.parsed_filters[2], Filter.from_doc("metrics", "sessions >= 100")
         )
 
+    def testParsedFiltersAreShared(self) -> None:
+        self.assertIs(
+            Filter.from_doc("metrics", "sessions >= 100"),
+            Filter.from_doc("metrics", "sessions >= 100"),
+        )
+
+    def testMutatingSerializedFilterLeavesParsedFilterUnchanged(self) -> None:
+        shared = Filter.from_doc("dimensions", "medium IN ('cpc', 'ppc')")
+        shared.to_request["expressions"].append("organic")
+        self.assertEqual(self.request_filters[1], shared.to_request)
+
     def testParseDocWithFilters(self) -> None:
         self.assertEqual(self.query, UARequest.from_doc(self.doc))
 
@@ -424,76 +470,47 @@ class TestBuildUARequestBatch(TestCase):
             metrics:
                 - 'sessions'
         """,
-        Loader=yaml.SafeLoader,
-    )
-
-    doc_2 = yaml.load(
-        """
-        scope:
-            viewId: 16619750
-        dateRanges:
-            - startDate: '2022-01-01'
-              endDate: '2022-03-31'
-        columns:
-            dimensions:
-                - 'campaign'
-            metrics:
-                - 'pageviews'
-        """,
-        Loader=yaml.SafeLoader,
+        Loader=YamlLoader,
     )
 
-    doc_3 = yaml.load(
-        """
-        scope:
-            viewId: 16619750
-        dateRanges:
-            - startDate: '2022-04-01'
-              endDate: '2022-06-30'
-        columns:
-            dimensions:
-                - 'date'
-            metrics:
-                - 'sessions'
-        """,
-        Loader=yaml.SafeLoader,
-    )
+    # The other documents only differ from the first in their columns or dates
+    doc_2 = doc_1 | {"columns": {"dimensions": ["campaign"], "metrics": ["pageviews"]}}
+    doc_3 = doc_1 | {
+        "dateRanges": [{"startDate": "2022-04-01", "endDate": "2022-06-30"}]
+    }
 
-    def setUp(self) -> None:
-        self.batch1 = [
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.batch1 = [
             UARequest(
-                key=UARequestKey(
-                    16619750, (DateRange(date(2022, 1, 1), date(2022, 3, 31)),)
-                ),
+                key=UARequestKey(16619750, (Q1_2022,)),
                 columns=[
-                    Column(ColumnType.DIMENSION, "date"),
-                    Column(ColumnType.METRIC, "sessions"),
+                    DATE_DIMENSION,
+                    SESSIONS_METRIC,
                 ],
             ),
             UARequest(
-                key=UARequestKey(
-                    16619750, (DateRange(date(2022, 1, 1), date(2022, 3, 31)),)
-                ),
+                key=UARequestKey(16619750, (Q1_2022,)),
                 columns=[
                     Column(ColumnType.DIMENSION, "campaign"),
                     Column(ColumnType.METRIC, "pageviews"),
                 ],
             ),
         ]
-        self.batch2 = [
+        cls.batch2 = [
             UARequest(
                 key=UARequestKey(
                     16619750, (DateRange(date(2022, 4, 1), date(2022, 6, 30)),)
                 ),
                 columns=[
-                    Column(ColumnType.DIMENSION, "date"),
-                    Column(ColumnType.METRIC, "sessions"),
+                    DATE_DIMENSION,
+                    SESSIONS_METRIC,
                 ],
             ),
         ]
-        key1 = self.batch1[0].key
-        key2 = self.batch2[0].key
-        self.batches = UARequestBatch({key1: self.batch1, key2: self.batch2})
+        key1 = cls.batch1[0].key
+        key2 = cls.batch2[0].key
+        cls.batches = UARequestBatch({key1: cls.batch1, key2: cls.batch2})
 
     def tearDown(self) -> None:
         UARequestBatch.MAXSIZE = 5
@@ -508,19 +525,14 @@ class TestBuildUARequestBatch(TestCase):
             "reportRequests": [self.batch1[0].to_request, self.batch1[1].to_request]
         }
         request2 = {"reportRequests": [self.batch2[0].to_request]}
-        result = self.batches.to_request
-        self.assertIn(request1, result)
-        self.assertIn(request2, result)
+        self.assertCountEqual(self.batches.to_request, [request1, request2])
 
     def testBuildRequestFromBatchWithSplitting(self) -> None:
         UARequestBatch.MAXSIZE = 1
         request1 = {"reportRequests": [self.batch1[0].to_request]}
         request2 = {"reportRequests": [self.batch1[1].to_request]}
         request3 = {"reportRequests": [self.batch2[0].to_request]}
-        result = self.batches.to_request
-        self.assertIn(request1, result)
-        self.assertIn(request2, result)
-        self.assertIn(request3, result)
+        self.assertCountEqual(self.batches.to_request, [request1, request2, request3])
 
 
 if __name__ == "__main__":
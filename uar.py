@@ -3,24 +3,22 @@ import yaml
 import re
 from datetime import date, timedelta
 from typing import (
-    TypedDict,
     Optional,
     TYPE_CHECKING,
     Callable,
     Any,
     TypeVar,
     ParamSpec,
-    Literal,
     TypeGuard,
     ClassVar,
     overload,
 )
-from itertools import chain, count, repeat, groupby
+from itertools import chain
+from functools import lru_cache
 from collections import UserDict
 from collections.abc import Sequence, Iterable
 
-from attrs import frozen, field, define, fields
-from attrs import validators as validators
+from attrs import frozen, field, define, Factory
 
 from uar_types import (
     DateRangeJson,
@@ -29,7 +27,7 @@ from uar_types import (
     FilterOperator,
     VersionedParser,
     FilterType,
-    Expression,
+    build_expr_parser,
     KeyRequestPair,
     RequestBatchDict,
 )
@@ -44,27 +42,50 @@ T = TypeVar("T")
 U = TypeVar("U")
 
 
-def camel_to_snake_case(instr: str) -> str:
-    """Convert string from camelCase to snake_case"""
+SNAKE_CASE_HUMP = re.compile(r"_([a-z])")
 
-    def repl(x: re.Match) -> str:
-        return f"_{x.group(1).lower()}"
+# document keys naming each filter / column type, singular or plural
+FILTER_TYPE_NAMES = {
+    name: ftype
+    for ftype in FilterType
+    for name in (ftype.name.lower(), f"{ftype.name.lower()}s")
+}
+COLUMN_TYPE_NAMES = {
+    name: ctype
+    for ctype in ColumnType
+    for name in (ctype.name.lower(), f"{ctype.name.lower()}s")
+}
+# request key for each filter type's clauses, in FilterType order
+FILTER_CLAUSE_KEYS = {
+    ftype: f"{ftype.name.lower()}FilterClauses" for ftype in FilterType
+}
 
-    return re.sub(r"([A-Z])", repl, instr)
+
+@lru_cache(maxsize=32)
+def camel_to_snake_case(instr: str) -> str:
+    """Convert string from camelCase to snake_case
+
+    Only a handful of distinct option keys are ever converted, so results are
+    cached.
+    """
+    if instr.islower():  # nothing to convert
+        return instr
+    return "".join(f"_{c.lower()}" if "A" <= c <= "Z" else c for c in instr)
 
 
 def snake_to_camel_case(instr: str) -> str:
     def repl(x: re.Match) -> str:
         return f"{x.group(1).upper()}"
 
-    return re.sub(r"_([a-z])", repl, instr)
+    if "_" not in instr:  # nothing to convert
+        return instr
+    return SNAKE_CASE_HUMP.sub(repl, instr)
 
 
-def chunk(iterable: Iterable[T], chunksize: int) -> map[list[T]]:
-    counter = chain.from_iterable(map(lambda x: repeat(x, chunksize), count(0)))
-    zipped = zip(counter, iterable)
-    groups = groupby(zipped, lambda x: x[0])
-    return map(lambda x: list(map(lambda y: y[1], x[1])), groups)
+def chunk(iterable: Iterable[T], chunksize: int) -> list[list[T]]:
+    """Split an iterable into lists of at most chunksize items"""
+    items = iterable if isinstance(iterable, list) else list(iterable)
+    return [items[i : i + chunksize] for i in range(0, len(items), chunksize)]
 
 
 def len_between(min_len: int, max_len: int):
@@ -87,12 +108,8 @@ def same_key(self, attribute: Attribute, value: list[UARequest]) -> None:
         - cohorts
     """
 
-    def check_key(request: UARequest) -> bool:
-        return request.key != key
-
     key = value[0].key
-    # ignore mypy type inference bug in filter function here
-    if any(filter(check_key, value)):  # type: ignore
+    if any(request.key != key for request in value[1:]):
         raise ValueError(err_str)
 
 
@@ -106,17 +123,42 @@ def compose_validators(
     return check
 
 
+def built_once(builder: Callable[[Any], Any]) -> Any:
+    """Field holding data derived from a frozen instance, built once at init"""
+    return field(
+        init=False, eq=False, repr=False, default=Factory(builder, takes_self=True)
+    )
+
+
+def freeze_list(value: Any) -> Any:
+    """Store list values as tuples, so instances shared by caches are immutable"""
+    return tuple(value) if isinstance(value, list) else value
+
+
 @frozen
 class DateRange(Sequence, VersionedParser):
     start_date: date
     end_date: date
+    # day numbers (date.toordinal) of the endpoints, for integer comparisons
+    start_ordinal: int = field(
+        init=False,
+        eq=False,
+        repr=False,
+        default=Factory(lambda self: self.start_date.toordinal(), takes_self=True),
+    )
+    end_ordinal: int = field(
+        init=False,
+        eq=False,
+        repr=False,
+        default=Factory(lambda self: self.end_date.toordinal(), takes_self=True),
+    )
 
     def __len__(self) -> int:
-        return (self.end_date - self.start_date).days + 1
+        return self.end_ordinal - self.start_ordinal + 1
 
     def __contains__(self, item) -> TypeGuard[date | str]:
         if isinstance(item, date):
-            return self.start_date <= item and item <= self.end_date
+            return self.start_ordinal <= item.toordinal() <= self.end_ordinal
         if isinstance(item, str):
             try:
                 return date.fromisoformat(item) in self
@@ -147,9 +189,13 @@ class DateRange(Sequence, VersionedParser):
 
     @classmethod
     def from_doc(cls, obj: DateRangeJson) -> DateRange:
-        return cls(
-            date.fromisoformat(obj["startDate"]), date.fromisoformat(obj["endDate"])
-        )
+        return cls.from_iso(obj["startDate"], obj["endDate"])
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def from_iso(cls, start_date: str, end_date: str) -> DateRange:
+        """Build a date range from ISO dates, sharing identical ranges"""
+        return cls(date.fromisoformat(start_date), date.fromisoformat(end_date))
 
     @property
     def to_request(self) -> dict[str, str]:
@@ -175,27 +221,30 @@ class Filter(VersionedParser):
     ftype: FilterType
     operator: FilterOperator
     column: str
-    value: int | str | list[str]
+    value: int | str | tuple[str, ...] = field(converter=freeze_list)
 
     @classmethod
+    @lru_cache(maxsize=1024)
     def from_doc(cls, ftype: str, expr: str):
-        parsed = Expression.parse_string(expr)[0]
+        """Parse a filter expression
+
+        Parsed filters are cached & shared between callers.
+        """
+        parsed = build_expr_parser().parse_string(expr)[0]
         column = parsed[0][0]
         operator = FilterOperator.get("expr", parsed[1])
         if operator == FilterOperator.IN:
-            value = list(parsed[2])
+            value = tuple(parsed[2])
         else:
             value = parsed[2]
-
-        ftype = ftype.upper()
-        if ftype[-1] == "S":  # strip trailing plurals
-            ftype = ftype[:-1]
-        return Filter(FilterType[ftype], operator, column, value)
+        return Filter(FILTER_TYPE_NAMES[ftype.lower()], operator, column, value)
 
     @property
     def to_request(self) -> dict[str, Any]:
+        """Produce concrete API request data for this filter"""
+
         def serialize_dimension():
-            value = self.value if self.operator == FilterOperator.IN else [self.value]
+            value = list(self.value) if self.operator == FilterOperator.IN else [self.value]
             return {
                 "dimensionName": f"ga:{self.column}",
                 "not": self.operator.value.ua.negated,
@@ -227,11 +276,9 @@ class Column(VersionedParser):
     # to-do: add histogram bucket support
 
     @classmethod
+    @lru_cache(maxsize=1024)
     def from_doc(cls, ctype: str, src: str):
-        ctype = ctype.upper()
-        if ctype[-1] == "S":  # strip trailing plurals
-            ctype = ctype[:-1]
-        return Column(ColumnType[ctype], src)
+        return Column(COLUMN_TYPE_NAMES[ctype.lower()], src)
 
     @property
     def to_request(self) -> dict[str, Any]:
@@ -243,7 +290,15 @@ class Column(VersionedParser):
         return NotImplemented
 
 
-@frozen
+def split_columns(columns: Iterable[Column]) -> dict[ColumnType, list[Column]]:
+    """Group columns by type, keeping their order within each type"""
+    buckets: dict[ColumnType, list[Column]] = {ctype: [] for ctype in ColumnType}
+    for col in columns:
+        buckets[col.ctype].append(col)
+    return buckets
+
+
+@frozen(cache_hash=True)
 class UARequestKey(VersionedParser):
     view_id: int
     date_ranges: tuple[DateRange, ...] = field(validator=len_between(1, 2))
@@ -256,20 +311,30 @@ class UARequestKey(VersionedParser):
     @classmethod
     def from_doc(cls, obj: dict[str, Any]):
         view_id = int(obj["scope"]["viewId"])
-        date_ranges = tuple(map(lambda x: DateRange.from_doc(x), obj["dateRanges"]))
+        date_ranges = tuple((x["startDate"], x["endDate"]) for x in obj["dateRanges"])
+        sampling = obj.get("queryOptions", {}).get("sampling")
+        return cls.from_parts(view_id, date_ranges, sampling)
 
-        if "queryOptions" in obj and "sampling" in obj["queryOptions"]:
-            sampling = SamplingLevel[obj["queryOptions"]["sampling"]]
-            return cls(view_id, date_ranges, sampling)
-        else:
-            return cls(view_id, date_ranges)
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def from_parts(
+        cls,
+        view_id: int,
+        date_ranges: tuple[tuple[str, str], ...],
+        sampling: Optional[str] = None,
+    ) -> UARequestKey:
+        """Build a request key from its raw values, sharing identical keys"""
+        ranges = tuple(DateRange.from_iso(start, end) for start, end in date_ranges)
+        if sampling is None:
+            return cls(view_id, ranges)
+        return cls(view_id, ranges, SamplingLevel[sampling])
 
     @property
     def to_request(self) -> dict[str, Any]:
         """Produce concrete API request data for this query"""
         return {
             "viewId": str(self.view_id),
-            "dateRanges": list(map(lambda x: x.to_request, self.date_ranges)),
+            "dateRanges": [x.to_request for x in self.date_ranges],
             "samplingLevel": self.sampling.name,
         }
 
@@ -285,6 +350,7 @@ class UAQueryOptions(VersionedParser):
     include_empty_rows: bool = field(default=False)
     include_totals: bool = field(default=False)
     include_value_ranges: bool = field(default=False)
+    _request: dict[str, Any] = built_once(lambda self: self._build_request())
     key_list = [
         "pageSize",
         "pageToken",
@@ -292,37 +358,42 @@ class UAQueryOptions(VersionedParser):
         "includeTotals",
         "includeValueRanges",
     ]
+    # attribute names for the keys in key_list
+    attr_list = list(map(camel_to_snake_case, key_list))
 
     @classmethod
     def from_doc(cls, obj: dict[str, Any]):
         if "queryOptions" not in obj:
             return cls()
+        return cls.from_values(tuple(map(obj["queryOptions"].get, cls.key_list)))
 
-        opts = dict(
-            filter(
-                lambda kv: kv[1] is not None,
-                map(
-                    lambda opt: (
-                        camel_to_snake_case(opt),
-                        obj["queryOptions"].get(opt),
-                    ),
-                    cls.key_list,
-                ),
-            )
-        )
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def from_values(cls, values: tuple[Any, ...]) -> UAQueryOptions:
+        """Build options from values ordered as key_list, sharing identical ones"""
+        opts = {
+            attr: value
+            for attr, value in zip(cls.attr_list, values)
+            if value is not None
+        }
         return cls(**opts)
 
     @property
-    def to_request(self):
+    def to_request(self) -> dict[str, Any]:
         """Produce concrete API request data for this query"""
+        # the options are all scalars, so a shallow copy is enough
+        return dict(self._request)
+
+    def _build_request(self) -> dict[str, Any]:
         opts = {
             "pageSize": self.page_size,
             "includeEmptyRows": self.include_empty_rows,
             "hideTotals": not self.include_totals,
             "hideValueRanges": not self.include_value_ranges,
         }
-        pt = {"pageToken": self.page_token} if self.page_token is not None else {}
-        return opts | pt
+        if self.page_token is not None:
+            opts["pageToken"] = self.page_token
+        return opts
 
 
 @frozen
@@ -331,17 +402,21 @@ class UARequest(VersionedParser):
     columns: list[Column]
     filters: Optional[list[Filter]] = field(default=None)
     query_options: UAQueryOptions = field(default=UAQueryOptions())
+    # columns split by type in one pass, to default dimensions & metrics from
+    _columns_by_type: dict[ColumnType, list[Column]] = built_once(
+        lambda self: split_columns(self.columns)
+    )
     dimensions: list[Column] = field(validator=len_between(1, 7))
     metrics: list[Column] = field(validator=len_between(1, 10))
     version_key: tuple[int, ...] = field(default=(0, 1), kw_only=True)
 
     @dimensions.default
     def _dimension_factory(self):
-        return list(filter(lambda col: col.ctype == ColumnType.DIMENSION, self.columns))
+        return self._columns_by_type[ColumnType.DIMENSION]
 
     @metrics.default
     def _metric_factory(self):
-        return list(filter(lambda col: col.ctype == ColumnType.METRIC, self.columns))
+        return self._columns_by_type[ColumnType.METRIC]
 
     @classmethod
     def from_doc(cls, obj: dict[str, Any]):
@@ -378,34 +453,23 @@ class UARequest(VersionedParser):
     def to_request(self) -> dict[str, Any]:
         """Produce concrete API request data for this query"""
 
-        def build_filter_clause(
-            filter_type: FilterType,
-        ) -> tuple[str, Optional[list[dict]]]:
-            if self.filters is None:
-                filters = []
-            else:
-                filters = list(
-                    map(
-                        lambda _filter: _filter.to_request,
-                        filter(
-                            lambda _filter: _filter.ftype == filter_type, self.filters
-                        ),
-                    )
-                )
-            key = f"{filter_type.name.lower()}FilterClauses"
-            value = [{"operator": "AND", "filters": filters}]
-            return (key, value) if len(filters) > 0 else (key, None)
+        buckets: dict[FilterType, list[dict]] = {
+            ftype: [] for ftype in FILTER_CLAUSE_KEYS
+        }
+        for _filter in self.filters or ():
+            buckets[_filter.ftype].append(_filter.to_request)
 
         cols = {
-            "dimensions": list(map(lambda col: col.to_request, self.dimensions)),
-            "metrics": list(map(lambda col: col.to_request, self.metrics)),
+            "dimensions": [col.to_request for col in self.dimensions],
+            "metrics": [col.to_request for col in self.metrics],
+        }
+        filters = {
+            FILTER_CLAUSE_KEYS[ftype]: [
+                {"operator": "AND", "filters": clauses}
+            ]
+            for ftype, clauses in buckets.items()
+            if clauses
         }
-        filters = dict(
-            filter(
-                lambda x: x[1] is not None,
-                map(build_filter_clause, FilterType),
-            )
-        )
         return self.key.to_request | cols | filters | self.query_options.to_request
 
 
@@ -416,52 +480,25 @@ class UARequestBatch(UserDict, VersionedParser):
 
     @classmethod
     def from_doc(cls, docs: Sequence[dict[str, Any]]):
-        def get_key(query: UARequest) -> UARequestKey:
-            return query.key
-
-        def get_requests_with_key(key: UARequestKey) -> list[UARequest]:
-            def check_key_eq(query: UARequest) -> bool:
-                return query.key == key
-
-            return list(filter(check_key_eq, queries))
-
-        def make_kv_pair(key: UARequestKey) -> tuple[UARequestKey, list[UARequest]]:
-            return (key, get_requests_with_key(key))
-
-        queries = list(map(UARequest.from_doc, docs))
-        keys = set(map(get_key, queries))
-        pairs = map(make_kv_pair, keys)
-        return cls(dict(pairs))
+        buckets: dict[UARequestKey, list[UARequest]] = {}
+        for query in map(UARequest.from_doc, docs):
+            buckets.setdefault(query.key, []).append(query)
+        return cls(buckets)
 
     @property
     def to_kr_pairs(self) -> list[KeyRequestPair]:
-        def map_key_to_request_batch(key: UARequestKey) -> list[KeyRequestPair]:
-            def chunk_queries(queries: list[UARequest]) -> map[list[UARequest]]:
-                return chunk(queries, self.MAXSIZE)
-
-            def batch_to_request(batch: list[UARequest]) -> KeyRequestPair:
-                def get_request(query: UARequest) -> dict:
-                    return query.to_request
-
-                return KeyRequestPair(
-                    key, {"reportRequests": list(map(get_request, batch))}
-                )
-
-            def produce_query_batches(queries: list[UARequest]) -> list[KeyRequestPair]:
-                return list(map(batch_to_request, chunk_queries(queries)))
-
-            return produce_query_batches(self[key])
-
-        return list(chain.from_iterable(map(map_key_to_request_batch, self)))
+        """Pair each key with its queries' requests, at most MAXSIZE per batch"""
+        return [
+            KeyRequestPair(
+                key, {"reportRequests": [query.to_request for query in batch]}
+            )
+            for key, queries in self.items()
+            for batch in chunk(queries, self.MAXSIZE)
+        ]
 
     @property
     def to_request(self) -> list[RequestBatchDict]:
-        def requests_from_pairs(
-            krpairs: Sequence[KeyRequestPair],
-        ) -> list[RequestBatchDict]:
-            return list(map(lambda x: x.request, krpairs))
-
-        return requests_from_pairs(self.to_kr_pairs)
+        return [pair.request for pair in self.to_kr_pairs]
 
 
 @define
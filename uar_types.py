@@ -1,5 +1,6 @@
 from attrs import frozen, field
 from enum import Enum, auto
+from functools import cache
 from typing import (
     TypedDict,
     TypeVar,
@@ -10,14 +11,11 @@ from typing import (
     TYPE_CHECKING,
 )
 
-import pyparsing as pp
-from pyparsing import pyparsing_common as pp_common
-
 
 if TYPE_CHECKING:
+    import pyparsing as pp
     from uar import UARequestKey
 
-pp.ParserElement.enablePackrat()
 CURRENT_VERSION = (0, 1)
 
 
@@ -54,10 +52,16 @@ class AliasedEnum(Enum):
 
     @classmethod
     def get(cls, key_type: str, key_val):
-        def key_matches(member: AliasedEnum) -> bool:
-            return getattr(member.value, key_type) == key_val
+        return cls._lookup(key_type)[key_val]
 
-        return next(filter(key_matches, cls))
+    @classmethod
+    @cache
+    def _lookup(cls, key_type: str) -> dict[Any, "AliasedEnum"]:
+        """Map each value of the key type to the first member declaring it"""
+        table: dict[Any, AliasedEnum] = {}
+        for member in cls:
+            table.setdefault(getattr(member.value, key_type), member)
+        return table
 
 
 @frozen
@@ -104,7 +108,14 @@ class FilterOperator(AliasedEnum):
     GTE = AliasedValue(">=", UAFilterLiteral("LESS_THAN", True))
 
 
-def build_expr_parser() -> pp.ParserElement:
+@cache
+def build_expr_parser() -> "pp.ParserElement":
+    """Build the filter expression grammar, once, on first use"""
+    # Lazy load expensive module
+    import pyparsing as pp
+    from pyparsing import pyparsing_common as pp_common
+
+    pp.ParserElement.enablePackrat()
     Expression = pp.Forward().set_name("Expression")
     numeric_literal = pp_common.number
     string_literal = pp.QuotedString("'", esc_quote="''")
@@ -139,6 +150,3 @@ def build_expr_parser() -> pp.ParserElement:
         ],
     )
     return Expression
-
-
-Expression = build_expr_parser()